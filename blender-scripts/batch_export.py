@@ -0,0 +1,193 @@
+"""
+Export a directory of .blend files to trove models, several background blenders at a time.
+
+    python3 blender-scripts/batch_export.py <blend dir> <output dir> [--jobs N] [--blender path]
+        [--format-version 6|7] [--precision P] [--cage] [--no-binary] [--force]
+
+Each model.blend becomes <output dir>/model.json, and its .bin companion, from trove_export.py
+running in a `blender --background` of its own, up to --jobs of them at once. Outputs are written
+to a scratch directory and moved into place once blender exits cleanly, so a failed or interrupted
+export never leaves half a model behind.
+
+manifest.json in the output directory records for every file the sha1 of the .blend, the exporter
+version and options it was exported with, how long the export took and how many bytes it wrote.
+A file whose hash, exporter version and options match its manifest entry, and whose outputs are
+still there, is skipped: rerunning after editing a few models only exports those. The exporter
+version is the sha1 of trove_export.py, so any change to the exporter exports everything again.
+"""
+import argparse
+import concurrent.futures
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+EXPORTER_PATH = os.path.join(scriptDir, "trove_export.py")
+MANIFEST_NAME = "manifest.json"
+LOG_TAIL_LINES = 20
+
+
+def fileHash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def exporterVersion():
+    return fileHash(EXPORTER_PATH)
+
+
+def loadManifest(manifestPath):
+    if not os.path.exists(manifestPath):
+        return {"files": {}}
+    with open(manifestPath) as f:
+        return json.load(f)
+
+
+def writeManifest(manifestPath, manifest):
+    """ replace the manifest in one step, an interrupted batch keeps every export finished so far """
+    partial = manifestPath + ".partial"
+    with open(partial, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(partial, manifestPath)
+
+
+def outputNames(blendName, options):
+    modelName = os.path.splitext(blendName)[0]
+    names = [modelName + ".json"]
+    if options["binary"]:
+        names.append(modelName + ".bin")
+    return names
+
+
+def isCurrent(entry, sourceHash, version, options, outDir):
+    """ True when the manifest entry is a successful export of this exact source with this exporter """
+    if not entry or "error" in entry:
+        return False
+    if entry["sourceHash"] != sourceHash or entry["exporterVersion"] != version or entry["options"] != options:
+        return False
+    return all(os.path.exists(os.path.join(outDir, name)) for name in entry["outputs"])
+
+
+def exporterArguments(jsonPath, options):
+    arguments = ["--output", jsonPath, "--format-version", str(options["formatVersion"]), "--precision", repr(options["precision"])]
+    if options["cage"]:
+        arguments.append("--cage")
+    if not options["binary"]:
+        arguments.append("--no-binary")
+    return arguments
+
+
+def tailLines(path, count):
+    with open(path, errors="replace") as f:
+        return "".join(f.readlines()[-count:])
+
+
+def exportFile(blender, blendPath, outDir, options):
+    """ run one background blender over blendPath, returning the manifest fields of its outputs.
+    Raises with the end of blender's log when the export fails, the full log is kept as <model>.log """
+    blendName = os.path.basename(blendPath)
+    names = outputNames(blendName, options)
+    scratchDir = tempfile.mkdtemp(prefix=".export-", dir=outDir)
+    try:
+        logPath = os.path.join(scratchDir, "blender.log")
+        command = [blender, "--background", blendPath, "--python", EXPORTER_PATH, "--"]
+        command += exporterArguments(os.path.join(scratchDir, names[0]), options)
+
+        start = time.perf_counter()
+        with open(logPath, "w") as log:
+            status = subprocess.call(command, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        duration = time.perf_counter() - start
+
+        # blender exits 0 when a --python script fails to load, the outputs are the real test
+        missing = [name for name in names if not os.path.exists(os.path.join(scratchDir, name))]
+        if status != 0 or missing:
+            failedLog = os.path.join(outDir, os.path.splitext(blendName)[0] + ".log")
+            shutil.copyfile(logPath, failedLog)
+            raise Exception("blender exited with {0}, missing {1}, see {2}:\n{3}".format(
+                status, missing, failedLog, tailLines(logPath, LOG_TAIL_LINES)))
+
+        outputBytes = 0
+        for name in names:
+            outputBytes += os.path.getsize(os.path.join(scratchDir, name))
+            os.replace(os.path.join(scratchDir, name), os.path.join(outDir, name))
+        return {"duration": duration, "outputBytes": outputBytes, "outputs": names}
+    finally:
+        shutil.rmtree(scratchDir, ignore_errors=True)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Export a directory of .blend files to trove models in parallel")
+    parser.add_argument("blendDir", help="directory holding the .blend files")
+    parser.add_argument("outDir", help="directory for the models and manifest.json")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="blender processes to run at once")
+    parser.add_argument("--blender", default="blender", help="blender executable")
+    parser.add_argument("--format-version", type=int, default=6, choices=(6, 7))
+    parser.add_argument("--precision", type=float, default=0.0001, help="quantization error bound of format version 7")
+    parser.add_argument("--cage", action="store_true", help="export meshes before their trailing subdivision")
+    parser.add_argument("--no-binary", action="store_true", help="skip the .bin companions")
+    parser.add_argument("--force", action="store_true", help="export every file, ignoring the manifest")
+    args = parser.parse_args(argv)
+
+    options = {
+        "formatVersion": args.format_version,
+        "precision": args.precision,
+        "cage": args.cage,
+        "binary": not args.no_binary
+    }
+    os.makedirs(args.outDir, exist_ok=True)
+    manifestPath = os.path.join(args.outDir, MANIFEST_NAME)
+    manifest = loadManifest(manifestPath)
+    entries = manifest.setdefault("files", {})
+    version = exporterVersion()
+
+    pending = []
+    skipped = 0
+    for blendPath in sorted(glob.glob(os.path.join(args.blendDir, "*.blend"))):
+        blendName = os.path.basename(blendPath)
+        sourceHash = fileHash(blendPath)
+        if not args.force and isCurrent(entries.get(blendName), sourceHash, version, options, args.outDir):
+            skipped += 1
+        else:
+            pending.append((blendName, blendPath, sourceHash))
+
+    failed = 0
+    # each worker only waits on its blender, the processes doing the work are the blenders themselves
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {}
+        for blendName, blendPath, sourceHash in pending:
+            future = pool.submit(exportFile, args.blender, blendPath, args.outDir, options)
+            futures[future] = (blendName, sourceHash)
+
+        for future in concurrent.futures.as_completed(futures):
+            blendName, sourceHash = futures[future]
+            entry = {
+                "sourceHash": sourceHash,
+                "exporterVersion": version,
+                "options": options,
+                "exportedAt": time.strftime("%Y-%m-%dT%H:%M:%S")
+            }
+            try:
+                entry.update(future.result())
+                print("exported {0} in {1:.1f} s, {2} bytes".format(blendName, entry["duration"], entry["outputBytes"]))
+            except Exception as e:
+                entry["error"] = str(e)
+                failed += 1
+                print("failed {0}: {1}".format(blendName, e), file=sys.stderr)
+            entries[blendName] = entry
+            writeManifest(manifestPath, manifest)
+
+    print("{0} exported, {1} unchanged, {2} failed".format(len(pending) - failed, skipped, failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
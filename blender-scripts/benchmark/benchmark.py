@@ -0,0 +1,183 @@
+"""
+Time blendlib's export pipeline over the bundled models without blender, using bpy_standin.
+
+    python3 blender-scripts/benchmark/benchmark.py [--repeat N] [--seed S] [--output results.json] [model.json ...]
+
+Every job parses the model json, materializes every mesh, bakes all operators at random weights,
+scales and grounds each mesh, extracts the export arrays and writes them as obj. The per-stage
+times come from blendlib's own trace spans. Boolean unions need blender and are left out, each
+mesh is exported on its own. Results go to stdout as a table and, with --output, to a json file
+tagged with the current commit so runs can be compared across commits.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+benchmarkDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmarkDir)
+sys.path.insert(0, os.path.dirname(benchmarkDir))
+
+import bpy_standin
+bpy_standin.install()
+import blendlib
+
+SIZE_BY_CATEGORY = {"ring": "ring_7", "bracelet": "bracelet_3", "necklace": "necklace_1"}
+
+
+def defaultModelPaths():
+    modelDir = os.path.join(benchmarkDir, "..", "..", "public", "models")
+    return sorted(glob.glob(os.path.join(os.path.normpath(modelDir), "*.json")))
+
+
+def randomWeights(model, rng):
+    weights = {}
+    for tMesh in model.meshObjects.values():
+        for operatorDef in tMesh.operatorDefs:
+            weights[operatorDef["id"]] = rng.random()
+    return weights
+
+
+def runJob(modelBytes, rng, exportFormat="obj"):
+    """ one export of every mesh of the model, returning its trace and the exported byte count """
+    bpy_standin.resetData()
+    trace = blendlib.beginTrace()
+
+    model = blendlib.TroveModel()
+    model.importBytes(modelBytes)
+    weights = randomWeights(model, rng)
+    size = SIZE_BY_CATEGORY.get(json.loads(modelBytes.decode("utf-8"))["metadata"].get("category"), "ring_7")
+
+    objects = []
+    for tMesh in model.meshObjects.values():
+        tMesh.materialize()
+        tMesh.bakeWeightedOperators(weights)
+        objects.append(tMesh.blendObject)
+
+    exportMeshes = blendlib.collectExportArrays(objects, True)
+    exportMeshes = blendlib.scaleExportArrays(exportMeshes, blendlib.sizeScaleFactor(size, model.diameter), ground=True)
+    out = io.BytesIO()
+    blendlib.writeExport(out, exportMeshes, exportFormat)
+
+    for coords, triangles, smooth, loopNormals in exportMeshes:
+        trace.count("vertices", len(coords))
+        trace.count("triangles", len(triangles))
+    return trace.asDict(), out.tell()
+
+
+def benchmarkModel(modelPath, repeat, rng):
+    with open(modelPath, "rb") as f:
+        modelBytes = f.read()
+
+    traces = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        # the first run warms up imports and allocator pools and is not counted
+        runJob(modelBytes, rng)
+        for i in range(repeat):
+            trace, byteSize = runJob(modelBytes, rng)
+            traces.append(trace)
+
+    vertices = traces[0]["counts"].get("vertices", 0)
+    stages = {}
+    for stage in traces[0]["stages"]:
+        seconds = sorted(trace["stages"].get(stage, 0) for trace in traces)
+        median = seconds[len(seconds) // 2]
+        stages[stage] = {
+            "median": median,
+            "min": seconds[0],
+            "verticesPerSecond": vertices / median if median else None
+        }
+
+    totals = sorted(trace["total"] for trace in traces)
+    medianTotal = totals[len(totals) // 2]
+    return {
+        "model": os.path.basename(modelPath),
+        "modelBytes": len(modelBytes),
+        "vertices": vertices,
+        "triangles": traces[0]["counts"].get("triangles", 0),
+        "operators": traces[0]["counts"].get("operators", 0),
+        "outputBytes": byteSize,
+        "repeat": repeat,
+        "total": {"median": medianTotal, "min": totals[0]},
+        "jobsPerSecond": 1 / medianTotal,
+        "verticesPerSecond": vertices / medianTotal,
+        "stages": stages
+    }
+
+
+def peakRSSBytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def currentCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=benchmarkDir, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def printReport(report):
+    stageNames = []
+    for result in report["models"]:
+        for stage in result["stages"]:
+            if stage not in stageNames:
+                stageNames.append(stage)
+
+    header = ["model", "verts", "jobs/s", "Mverts/s"] + [stage + " ms" for stage in stageNames]
+    print("  ".join(header))
+    for result in report["models"]:
+        row = [result["model"], str(result["vertices"]), "%.2f" % result["jobsPerSecond"], "%.2f" % (result["verticesPerSecond"] / 1e6)]
+        for stage in stageNames:
+            stat = result["stages"].get(stage)
+            row.append("%.2f" % (stat["median"] * 1000) if stat else "-")
+        print("  ".join(row))
+    print("peak RSS: %.1f MB" % (report["peakRSSBytes"] / (1024 * 1024)))
+
+
+def positiveInt(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {0}".format(value))
+    return value
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the blendlib export pipeline over trove models")
+    parser.add_argument("models", nargs="*", help="model json files, defaults to public/models/*.json")
+    parser.add_argument("--repeat", type=positiveInt, default=5, help="timed jobs per model")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random operator weights")
+    parser.add_argument("--output", help="write the results to this json file")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    modelPaths = args.models or defaultModelPaths()
+    results = [benchmarkModel(modelPath, args.repeat, rng) for modelPath in modelPaths]
+
+    report = {
+        "commit": currentCommit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": blendlib.np.__version__,
+        "seed": args.seed,
+        "peakRSSBytes": peakRSSBytes(),
+        "models": results
+    }
+
+    printReport(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,220 @@
+"""
+Just enough of bpy, bmesh and mathutils for blendlib's numpy paths to run under a plain python3.
+
+Meshes keep their attributes as numpy arrays and implement the foreach_get / foreach_set / add
+calls blendlib uses, so timings reflect blendlib's own work plus one array copy per bulk call,
+roughly what blender costs for the same calls. Booleans and operators (bpy.ops) are not modelled.
+bpy.types, bpy.props and bpy_extras only go as far as letting trove_export define its operator, so
+its numpy helpers can be imported. Call install() before importing blendlib or trove_export.
+"""
+import sys
+import types
+import numpy as np
+
+
+class PropertyCollection():
+    """ a bpy_prop_collection of fixed-width numeric properties stored column-wise """
+    def __init__(self, fields):
+        self.fields = fields  # attribute name => (dtype, per-element shape)
+        self.columns = dict((name, np.zeros((0,) + shape, dtype=dtype)) for name, (dtype, shape) in fields.items())
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, count):
+        for name, (dtype, shape) in self.fields.items():
+            grown = np.zeros((self.size + count,) + shape, dtype=dtype)
+            grown[:self.size] = self.columns[name]
+            self.columns[name] = grown
+        self.size += count
+
+    def foreach_set(self, attr, seq):
+        column = self.columns[attr]
+        column[...] = np.asarray(seq).reshape(column.shape)
+
+    def foreach_get(self, attr, seq):
+        seq[...] = self.columns[attr].reshape(-1)
+
+    def copy(self):
+        duplicate = PropertyCollection(self.fields)
+        duplicate.columns = dict((name, column.copy()) for name, column in self.columns.items())
+        duplicate.size = self.size
+        return duplicate
+
+
+class Mesh():
+    def __init__(self, name):
+        self.name = name
+        self.users = 0
+        self.materials = []
+        self.vertices = PropertyCollection({"co": (np.float32, (3,)), "normal": (np.float32, (3,))})
+        self.loops = PropertyCollection({"vertex_index": (np.int32, ()), "normal": (np.float32, (3,))})
+        self.polygons = PropertyCollection({
+            "loop_start": (np.int32, ()),
+            "loop_total": (np.int32, ()),
+            "use_smooth": (np.bool_, ()),
+        })
+
+    def update(self, calc_edges=False, calc_tessface=False):
+        pass
+
+    def transform(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float64)
+        coords = self.vertices.columns["co"].astype(np.float64)
+        self.vertices.columns["co"] = (coords @ matrix[:3, :3].T + matrix[:3, 3]).astype(np.float32)
+
+    def polygonCorners(self):
+        loopStarts = self.polygons.columns["loop_start"]
+        return self.loops.columns["vertex_index"][loopStarts[:, None] + np.arange(3)]
+
+    def calc_normals(self):
+        """ area weighted vertex normals, every polygon being a triangle """
+        coords = self.vertices.columns["co"].astype(np.float64)
+        corners = self.polygonCorners()
+        faceNormals = np.cross(coords[corners[:, 1]] - coords[corners[:, 0]], coords[corners[:, 2]] - coords[corners[:, 0]])
+        normals = np.zeros_like(coords)
+        for corner in range(3):
+            np.add.at(normals, corners[:, corner], faceNormals)
+        lengths = np.linalg.norm(normals, axis=1)
+        lengths[lengths == 0] = 1
+        self.vertices.columns["normal"] = (normals / lengths[:, None]).astype(np.float32)
+
+    def calc_normals_split(self):
+        # smooth everywhere, which is all blendlib asks for
+        self.calc_normals()
+        self.loops.columns["normal"] = self.vertices.columns["normal"][self.loops.columns["vertex_index"]]
+
+    def copy(self, name=None):
+        duplicate = Mesh(name or self.name)
+        duplicate.vertices = self.vertices.copy()
+        duplicate.loops = self.loops.copy()
+        duplicate.polygons = self.polygons.copy()
+        return duplicate
+
+
+class Object():
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.location = (0, 0, 0)
+        self.dupli_type = 'NONE'
+        self.modifiers = []
+        data.users += 1
+
+    @property
+    def matrix_world(self):
+        matrix = np.identity(4)
+        matrix[:3, 3] = self.location
+        return matrix
+
+    def to_mesh(self, scene, apply_modifiers, settings):
+        return data.meshes.register(self.data.copy(self.data.name + ".export"))
+
+
+class NamedCollection():
+    """ bpy.data.meshes / bpy.data.objects: name unique datablocks in creation order """
+    def __init__(self, factory):
+        self.factory = factory
+        self.items = {}
+
+    def register(self, block):
+        base = block.name
+        suffix = 1
+        while block.name in self.items:
+            block.name = "%s.%03d" % (base, suffix)
+            suffix += 1
+        self.items[block.name] = block
+        return block
+
+    def new(self, name, *args):
+        return self.register(self.factory(name, *args))
+
+    def remove(self, block):
+        del self.items[block.name]
+        if isinstance(block, Object):
+            block.data.users -= 1
+
+    def keys(self):
+        return list(self.items.keys())
+
+    def __iter__(self):
+        return iter(list(self.items.values()))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, name):
+        return name in self.items
+
+
+class SceneObjects():
+    def __init__(self):
+        self.linked = {}
+        self.active = None
+
+    def link(self, ob):
+        self.linked[ob.name] = ob
+
+    def unlink(self, ob):
+        del self.linked[ob.name]
+
+    def __iter__(self):
+        return iter(list(self.linked.values()))
+
+    def __contains__(self, name):
+        return name in self.linked
+
+
+class BMesh():
+    """ every mesh blendlib builds is already triangulated, so there is nothing to do """
+    faces = ()
+
+    def from_mesh(self, mesh):
+        pass
+
+    def to_mesh(self, mesh):
+        pass
+
+    def free(self):
+        pass
+
+
+data = types.SimpleNamespace(meshes=NamedCollection(Mesh), objects=NamedCollection(Object))
+
+
+def resetData():
+    """ drop every datablock, the equivalent of starting blender with an empty scene """
+    data.meshes.items.clear()
+    data.objects.items.clear()
+    bpy.context.scene.objects = SceneObjects()
+
+
+bpy = types.ModuleType("bpy")
+bpy.data = data
+bpy.context = types.SimpleNamespace(scene=types.SimpleNamespace(objects=SceneObjects()))
+
+bmesh = types.ModuleType("bmesh")
+bmesh.new = BMesh
+bmesh.ops = types.SimpleNamespace(triangulate=lambda bm, faces: None)
+
+# enough for trove_export's class ExportTroveJSON(bpy.types.Operator, ExportHelper) to be defined
+bpy.types = types.SimpleNamespace(Operator=type("Operator", (), {}), Mesh=Mesh)
+bpy.props = types.SimpleNamespace(**dict((name, lambda **options: options.get("default")) for name in
+    ("StringProperty", "IntProperty", "BoolProperty", "FloatProperty")))
+
+bpy_extras = types.ModuleType("bpy_extras")
+bpy_extras.io_utils = types.ModuleType("bpy_extras.io_utils")
+bpy_extras.io_utils.ExportHelper = type("ExportHelper", (), {})
+
+mathutils = types.ModuleType("mathutils")
+mathutils.Matrix = lambda rows=None: np.identity(4) if rows is None else np.asarray(rows, dtype=np.float64)
+mathutils.Vector = lambda values: np.asarray(values, dtype=np.float64)
+
+
+def install():
+    sys.modules["bpy"] = bpy
+    sys.modules["bmesh"] = bmesh
+    sys.modules["mathutils"] = mathutils
+    sys.modules["bpy_extras"] = bpy_extras
+    sys.modules["bpy_extras.io_utils"] = bpy_extras.io_utils
@@ -1,42 +1,125 @@
 
-import bpy
+import base64
+import binascii
+import contextlib
+import functools
+import hashlib
 import json
+import mmap
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
 import time
+import traceback
+import urllib.error
 import urllib.request
-import mathutils
+import numpy as np
+from collections import OrderedDict
+
+try:
+    import bpy
+except ImportError:
+    # nplib imports this module under a plain python for everything that is only numpy
+    bpy = None
 
 exportFrame = 1
 
+
+class ExportTrace():
+    """ wall clock time spent in each export stage plus geometry counts, reported with the result """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = OrderedDict()  # stage => seconds, summed over every span of that stage
+        self.counts = OrderedDict()
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0) + time.perf_counter() - start
+
+    def count(self, name, amount):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def asDict(self):
+        return {
+            "total": time.perf_counter() - self.start,
+            "stages": self.stages,
+            "counts": self.counts
+        }
+
+
+currentTrace = ExportTrace()
+
+
+def beginTrace():
+    """ start recording a fresh trace, everything traced from now on lands in it """
+    global currentTrace
+    currentTrace = ExportTrace()
+    return currentTrace
+
+
+def traceSpan(stage):
+    return currentTrace.span(stage)
+
+
+def traceCount(name, amount):
+    currentTrace.count(name, amount)
+
+
+def traced(stage):
+    """ decorator adding the time of every call to a stage of the current trace """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with traceSpan(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
 # export obj
 
 class TroveModel():
     def __init__(self, modelJSON=None):
-        self.meshObjects = {}  # meshID => Object(ID) with .data containing mesh
+        self.meshObjects = OrderedDict()  # meshID => TroveMesh, in file order; blender data is built on demand
 
         if modelJSON:
             self.importJSON(modelJSON)
 
     def importJSON(self, modelJSON):
         self.diameter = modelJSON["metadata"]["diameter"]
+        self.formatVersion = modelFormatVersion(modelJSON)
 
         for meshDef in modelJSON["meshes"]:
-            tmesh = TroveMesh(meshDef)
+            tmesh = TroveMesh(meshDef, self.formatVersion)
             self.meshObjects[tmesh.name] = tmesh
 
+        # operators stay as raw definitions grouped by mesh until that mesh is actually exported
         for op in modelJSON["operators"]:
-            parsedOp = TroveOperator(op)
-            self.meshObjects[parsedOp.mesh].registerOperator(parsedOp)
-
-    def importFile(self, localPath):
-        f = open(localPath, "r")
-        self.importJSON(json.loads(f.read()))
+            self.meshObjects[canonicalMeshID(op["mesh"])].registerOperatorDef(op)
 
+    @traced("parse")
+    def importBytes(self, data):
+        """ data is a json model or its binary companion, as bytes or any other buffer (an mmap) """
+        if data[:len(BINARY_MODEL_MAGIC)] == BINARY_MODEL_MAGIC:
+            self.importJSON(readBinaryModel(data))
+        else:
+            self.importJSON(json.loads(bytes(data).decode('utf-8')))
 
+    def resetMeshes(self):
+        """ undo generateCombinedMesh: restore every materialized mesh from its pristine arrays """
+        for tMesh in self.meshObjects.values():
+            if tMesh.blendObject:
+                tMesh.resetGeometry()
 
-    def importURL(self, modelURL):
-        response = urllib.request.urlopen(modelURL)
-        data = response.read()
-        self.importJSON(json.loads(data.decode('utf-8')))
+    def blendObjectNames(self):
+        return set(tMesh.blendObject.name for tMesh in self.meshObjects.values() if tMesh.blendObject)
 
     def getDefaultVisible(self):
         channelDefault = {}
@@ -47,8 +130,9 @@ class TroveModel():
         return list(channelDefault.values())
 
 
-    def generateExportMesh(self, size, visible, weights, enableRender, importBucket):
-        """ this is destructive, mesh data is broken and needs to be reset """
+    def generateCombinedMesh(self, size, visible, weights, enableRender, importBucket, downloadCache=None):
+        """ the baked and combined visible meshes, before sizing; size only matters for its
+        category. This is destructive, mesh data is broken and needs to be reset with resetMeshes """
 
         visibleObjects = []
         if not visible:
@@ -56,143 +140,391 @@ class TroveModel():
 
         for meshID, tMesh in self.meshObjects.items():
             if meshID in visible:
+                tMesh.materialize()
                 tMesh.bakeWeightedOperators(weights)
-                visibleObjects.append(tMesh.blendObject)
+                visibleObjects.append(tMesh.subdividedObject())
 
         sizeCategory, sizeValue = parseSize(size)
         if sizeCategory == "necklace" and enableRender:
-            tmesh = downloadChainMesh(importBucket)
+            tmesh = downloadChainMesh(importBucket, downloadCache)
             visibleObjects.append(tmesh.blendObject)
 
         if len(visibleObjects) == 0:
             raise Exception("Error: No visible objects to export. Make sure mesh IDs in the visible list parameter match the json.")
 
-        finalMeshObject = combineObjects(visibleObjects)
-        applyScale(finalMeshObject, size, self.diameter)
-        if enableRender:
-            offset = calculateOffset(finalMeshObject)
-            finalMeshObject.location.y += offset
-            applyLocRotScale(finalMeshObject)
-
-            finalMeshObject.data.calc_normals()
-        return finalMeshObject
+        return combineObjects(visibleObjects)
 
 
-def calculateOffset(obj):
-    minValue = float("inf")
-    for v in obj.data.vertices:
-        if v.co.y < minValue:
-            minValue = v.co.y
-    return -minValue
-
-
-def applyLocRotScale(obj):
-    context = bpy.context.copy()
-    context["scene"] = bpy.context.scene
-    context["active_object"] = obj
-
-    bpy.ops.object.transform_apply(context, location=True, rotation=False, scale=False)
+def groundOffset(coords, scaleFactor=1):
+    """ the y translation resting the mesh on y = 0 once scaled by scaleFactor """
+    if not len(coords):
+        return 0
+    return -(coords[:, 1].min() * scaleFactor)
 
 
 class TroveMesh():
-    def __init__(self, meshDef):
+    def __init__(self, meshDef, formatVersion=6):
         self.parseMeta(meshDef)
-        self.parseBlendMesh(meshDef)
-        self.blendObject = addToScene(self.blendMesh)
+        self.source = meshDef
+        self.formatVersion = formatVersion
+        self.blendMesh = None
+        self.blendObject = None
+        self.operatorDefs = []  # raw json definitions, parsed on materialize
         self.operators = {}  # operatorID => representation of operators
-        # self.source = meshDef
+
+
+    def registerOperatorDef(self, operatorDef):
+        self.operatorDefs.append(operatorDef)
 
 
     def registerOperator(self, parsedOp):
         self.operators[parsedOp.name] = parsedOp
 
 
+    def resetGeometry(self):
+        writeCoordinates(self.blendMesh, self.vertexArray)
+        self.blendObject.location = (0, 0, 0)
+
+
+    def parseArrays(self):
+        """ the pristine vertex and triangle arrays plus the operator arrays, once, on first use """
+        if self.source is None:
+            return
+
+        # (V, 3) / (F, 3) arrays, also kept around so the mesh can be rebuilt without the json
+        if self.formatVersion >= QUANTIZED_FORMAT_VERSION:
+            vertices = decodeFixedPoint(self.source["vertices"], self.source["vertexScale"], self.source["vertexOffset"])
+            triangles = decodeDeltas(self.source["triangles"])
+        else:
+            vertices = self.source["vertices"]
+            triangles = self.source["triangles"]
+        self.vertexArray = np.asarray(vertices, dtype=np.float32)[:self.numVerts * 3].reshape(-1, 3)
+        self.triangleArray = np.asarray(triangles, dtype=np.int32)[:self.numFaces * 3].reshape(-1, 3)
+        # cage meshes list the sizes of the polygons their triangles are fans of
+        self.polygonSizes = None
+        if "polygonSizes" in self.source:
+            self.polygonSizes = np.asarray(self.source["polygonSizes"], dtype=np.int32)
+        for operatorDef in self.operatorDefs:
+            self.registerOperator(TroveOperator(operatorDef, self.formatVersion))
+        self.operatorMatrix = OperatorMatrix(self.vertexArray, list(self.operators.values()))
+
+        # the pristine arrays now carry everything the json did
+        self.source = None
+        self.operatorDefs = []
+
+
+    @traced("meshBuild")
+    def materialize(self):
+        """ build the blender mesh and its scene object, once, on first use """
+        if self.blendObject:
+            return self.blendObject
+
+        self.parseArrays()
+        self.parseBlendMesh()
+        self.blendObject = addToScene(self.blendMesh)
+        return self.blendObject
+
+
+    @traced("bake")
     def bakeWeightedOperators(self, weights):
         """ alter this mesh's vertex data to get straightforward output """
-        for operatorID, op in self.operators.items():
-            if operatorID not in weights:
-                normalizedValue = 0
-            else:
-                normalizedValue = weights[operatorID]
+        writeCoordinates(self.blendMesh, self.operatorMatrix.bake(weights))
+
+
+    @traced("subdivide")
+    def subdividedObject(self):
+        """ the blender object to export: the materialized object itself, or for a cage mesh a
+        scratch object holding its subdivision at the current (baked) vertex positions """
+        if not self.subdivisionLevels:
+            return self.blendObject
+        return subdivideObject(self.blendObject, self.subdivisionLevels)
+
+
+    @traced("bake")
+    def bakedCoordinates(self, weights):
+        """ bakeWeightedOperators without blender: (V, 3) float32 baked copy of the pristine vertices """
+        return self.operatorMatrix.bake(weights).astype(np.float32)
 
-            weightRange = op.maxWeight - op.minWeight
-            operatorValue = op.minWeight + (weightRange * normalizedValue)
-            op.applyToMesh(operatorValue, self.blendMesh)
 
     def parseMeta(self, meshDef):
         # FIXME: update old models to make interface consistent, or custom handling based on version number
 
-        meshID = meshDef["id"]
-        if meshID == "Cube":
-            meshID = "Cube-Alternate"
-
-        self.name = meshID
+        self.name = canonicalMeshID(meshDef["id"])
         self.channel = meshDef["channelID"]
         self.numVerts = meshDef["numvertices"]
         self.numFaces = meshDef["numtriangles"]
+        self.subdivisionLevels = meshDef.get("subdivisionLevels", 0)
 
 
-    def parseBlendMesh(self, meshDef):
-        rawVertexData = meshDef["vertices"]
-        rawFaceData = meshDef["triangles"]
+    def parseBlendMesh(self):
+        # bulk equivalent of from_pydata(verts, [], faces) without building a python tuple per element
+        newMesh = bpy.data.meshes.new(self.name)
+        newMesh.vertices.add(self.numVerts)
+        newMesh.vertices.foreach_set("co", self.vertexArray.ravel())
 
-        # this method seems inefficient, figure out importing numpy library to get following lines to work
-        # verts = numpy.reshape(rawVertexData, (-1, 3))
-        # faces = numpy.reshape(rawFacexData, (-1, 3))
-        verts = []
-        faces = []
-        for i in range(self.numVerts):
-            j = i * 3
-            verts.append((rawVertexData[j], rawVertexData[j + 1], rawVertexData[j + 2]))
+        if self.polygonSizes is not None:
+            loopVerts, loopStarts, loopTotals = fanPolygons(self.triangleArray, self.polygonSizes)
+        else:
+            loopVerts = self.triangleArray.ravel()
+            loopStarts = np.arange(0, self.numFaces * 3, 3, dtype=np.int32)
+            loopTotals = np.full(self.numFaces, 3, dtype=np.int32)
 
-        for i in range(self.numFaces):
-            j = i * 3
-            faces.append((rawFaceData[j], rawFaceData[j + 1], rawFaceData[j + 2]))
+        newMesh.loops.add(len(loopVerts))
+        newMesh.loops.foreach_set("vertex_index", loopVerts)
 
-        newMesh = bpy.data.meshes.new(self.name)
-        newMesh.from_pydata(verts,[],faces)
+        newMesh.polygons.add(len(loopStarts))
+        newMesh.polygons.foreach_set("loop_start", loopStarts)
+        newMesh.polygons.foreach_set("loop_total", loopTotals)
 
-        newMesh.update(calc_tessface=True)  # calc_edges=True
+        newMesh.update(calc_edges=True, calc_tessface=True)
         self.blendMesh = newMesh
         return newMesh
 
 
 
 class TroveOperator():
-    def __init__(self, operatorDef):
+    def __init__(self, operatorDef, formatVersion=6):
         self.name = operatorDef["id"]
         self.type = operatorDef["type"]
-        self.mesh = operatorDef["mesh"]
+        self.mesh = canonicalMeshID(operatorDef["mesh"])
         self.minWeight = operatorDef.get("minWeight", 0)
         self.maxWeight = operatorDef.get("maxWeight", 1)
 
-        # hack because of initial cube
-        if self.mesh == "Cube":
-            self.mesh = "Cube-Alternate"
-
         params = operatorDef["parameters"]
-        disps = params["displacements"]
+        count = params["modifiedCount"]
+        if formatVersion >= QUANTIZED_FORMAT_VERSION:
+            indices = decodeDeltas(params["indices"])
+            displacements = decodeFixedPoint(params["displacements"], params["displacementScale"])
+        else:
+            indices = params["indices"]
+            displacements = params["displacements"]
+        self.indices = np.asarray(indices, dtype=np.int32)[:count]
+        self.displacements = np.asarray(displacements, dtype=np.float32)[:count * 3].reshape(-1, 3)
+
+
 
-        self.displacements = []
-        for i in range(params["modifiedCount"]):
-            j = i * 3
-            index = params["indices"][i]
-            disp = mathutils.Vector((disps[j], disps[j+1], disps[j+2]))
-            self.displacements.append((index, disp))
+# binary companion written by trove_export.BinaryCompanion:
+#   "TROVEBIN" | uint32 LE header length | utf-8 json header | zero padding to a multiple of 8 | data
+# the header is the json model with vertices, triangles, indices and displacements replaced by
+# {"dtype", "count", "offset"} descriptors, offset counting bytes from the start of the data, and
+# sourceMD5, the MD5 of the json it was written with
+BINARY_MODEL_MAGIC = b"TROVEBIN"
 
-    def applyToMesh(self, value, mesh):
-        for index, disp in self.displacements:
-            mesh.vertices[index].co.x += disp.x * value
-            mesh.vertices[index].co.y += disp.y * value
-            mesh.vertices[index].co.z += disp.z * value
 
+def readBinaryHeader(buffer):
+    """ the json header of a binary companion and where its data starts """
+    headerStart = len(BINARY_MODEL_MAGIC) + 4
+    headerLength, = struct.unpack_from("<I", buffer, len(BINARY_MODEL_MAGIC))
+    header = json.loads(bytes(buffer[headerStart:headerStart + headerLength]).decode('utf-8'))
+    dataStart = headerStart + headerLength
+    return header, dataStart + -dataStart % 8
 
-def downloadChainMesh(bucketName):
+
+def readBinaryModel(buffer):
+    """ the model json of a binary companion, its arrays being numpy views straight into buffer """
+    header, dataStart = readBinaryHeader(buffer)
+
+    def view(block):
+        return np.frombuffer(buffer, dtype=block["dtype"], count=block["count"], offset=dataStart + block["offset"])
+
+    for meshDef in header["meshes"]:
+        meshDef["vertices"] = view(meshDef["vertices"])
+        meshDef["triangles"] = view(meshDef["triangles"])
+    for operatorDef in header["operators"]:
+        params = operatorDef["parameters"]
+        params["indices"] = view(params["indices"])
+        params["displacements"] = view(params["displacements"])
+    return header
+
+
+# formatVersion 7 stores each numeric array as a base64 string of zigzag LEB128 varints: positions
+# and displacements as fixed-point integers, value = integer * scale + offset, triangle and operator
+# indices as differences from the previous index. metadata.precision bounds the absolute error of
+# every decoded position and displacement, before rounding to float32
+QUANTIZED_FORMAT_VERSION = 7
+NEWEST_FORMAT_VERSION = 7
+
+
+def modelFormatVersion(modelJSON):
+    formatVersion = modelJSON["metadata"].get("formatVersion", 6)
+    if formatVersion > NEWEST_FORMAT_VERSION:
+        raise Exception("Error: model format version {0} is newer than this reader supports".format(formatVersion))
+    return formatVersion
+
+
+def unpackIntegers(text):
+    """ the int64 values of a base64 string of zigzag varints """
+    data = np.frombuffer(base64.b64decode(text), dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # every value ends on its one byte without the continuation bit, 7 payload bits per byte
+    ends = np.flatnonzero(data < 128)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = (np.arange(len(data)) - np.repeat(starts, ends - starts + 1)) * 7
+    zigzag = np.add.reduceat((data & 127).astype(np.uint64) << shifts.astype(np.uint64), starts)
+    return (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+
+
+def decodeFixedPoint(text, scale, offset=0):
+    """ float32 values of a fixed-point array, offset being one value per column ([x, y, z] for vertices) """
+    columns = len(offset) if isinstance(offset, list) else 1
+    values = unpackIntegers(text).reshape(-1, columns) * scale + np.asarray(offset, dtype=np.float64)
+    return values.astype(np.float32).ravel()
+
+
+def decodeDeltas(text):
+    return np.cumsum(unpackIntegers(text)).astype(np.int32)
+
+
+def binaryCompanionURL(url):
+    root, extension = os.path.splitext(url)
+    return root + ".bin"
+
+
+def mapFile(path):
+    """ read only memory map of a whole file, which stays valid after the file is replaced or deleted """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class OperatorMatrix():
+    """ a mesh's operators as a sparse 3V x K matrix D of displacements, one column per operator,
+    plus the base positions the mesh takes with every normalized weight at 0, which is not the
+    pristine mesh for operators whose minWeight isn't 0. A bake is then base + D @ (range * weight)
+    and only has to visit the operators actually given a weight.
+
+    D is kept column-compressed, which is simply every operator's flattened coordinate indices and
+    displacements back to back: rows[columnStarts[k]:columnStarts[k + 1]] for column k.
+
+    The last bake is kept, and the next one only adds D @ (change in range * weight), visiting just
+    the operators whose weight moved. Every FULL_BAKE_INTERVAL such bakes it starts over from base,
+    bounding the rounding error they accumulate """
+    FULL_BAKE_INTERVAL = 32
+
+    def __init__(self, vertexArray, operators):
+        self.names = [op.name for op in operators]
+        self.minWeights = np.array([op.minWeight for op in operators], dtype=np.float64)
+        self.weightRanges = np.array([op.maxWeight - op.minWeight for op in operators], dtype=np.float64)
+        self.size = vertexArray.size
+
+        rowBlocks = [np.empty(0, dtype=np.int64)]
+        valueBlocks = [np.empty(0)]
+        for op in operators:
+            rowBlocks.append((op.indices.astype(np.int64)[:, None] * 3 + np.arange(3)).ravel())
+            valueBlocks.append(op.displacements.astype(np.float64).ravel())
+        self.columnStarts = np.cumsum([0] + [len(rows) for rows in rowBlocks[1:]])
+        self.rows = np.concatenate(rowBlocks)
+        self.values = np.concatenate(valueBlocks)
+
+        self.base = vertexArray.astype(np.float64).ravel() + self.product(self.minWeights)
+        self.baked = None  # flat 3V positions of the last bake
+        self.bakedWeights = None  # and the column weights it was made with
+        self.incrementalBakes = 0
+
+    def product(self, columnWeights):
+        """ D @ columnWeights as a flat 3V vector, skipping the columns weighted 0 """
+        columns = np.flatnonzero(columnWeights)
+        if not len(columns):
+            return np.zeros(self.size)
+
+        rowBlocks = []
+        valueBlocks = []
+        for k in columns:
+            column = slice(self.columnStarts[k], self.columnStarts[k + 1])
+            rowBlocks.append(self.rows[column])
+            valueBlocks.append(self.values[column] * columnWeights[k])
+        return np.bincount(np.concatenate(rowBlocks), np.concatenate(valueBlocks), minlength=self.size)
+
+    def bake(self, weights):
+        """ (V, 3) float64 vertex positions for the normalized weights, operatorID => [0, 1]. The
+        array is read only and only valid until the next bake """
+        normalized = np.array([weights.get(name, 0) for name in self.names], dtype=np.float64)
+        columnWeights = self.weightRanges * normalized
+
+        if self.baked is None or self.incrementalBakes >= self.FULL_BAKE_INTERVAL:
+            self.baked = self.base + self.product(columnWeights)
+            self.incrementalBakes = 0
+            traceCount("operators", int(np.count_nonzero(columnWeights)))
+        else:
+            changedWeights = columnWeights - self.bakedWeights
+            self.accumulate(self.baked, changedWeights)
+            self.incrementalBakes += 1
+            traceCount("operators", int(np.count_nonzero(changedWeights)))
+        self.bakedWeights = columnWeights
+
+        baked = self.baked.reshape(-1, 3)
+        baked.flags.writeable = False
+        return baked
+
+    def accumulate(self, target, columnWeights):
+        """ target += D @ columnWeights in place, touching only the rows of nonzero columns """
+        for k in np.flatnonzero(columnWeights):
+            column = slice(self.columnStarts[k], self.columnStarts[k + 1])
+            np.add.at(target, self.rows[column], self.values[column] * columnWeights[k])
+
+
+def fanPolygons(triangles, polygonSizes):
+    """ loop vertex indices, loop starts and loop totals of the polygons whose triangle fans,
+    (l0, l1, l2), (l0, l2, l3) ..., are listed in order in triangles """
+    fanCounts = polygonSizes - 2
+    fanStarts = np.cumsum(fanCounts) - fanCounts
+    loopTotals = polygonSizes.astype(np.int32)
+    loopStarts = (np.cumsum(loopTotals) - loopTotals).astype(np.int32)
+
+    # the first triangle of a fan gives the first three corners, each following one a corner more
+    loopVerts = np.empty(int(loopTotals.sum()), dtype=np.int32)
+    loopVerts[loopStarts] = triangles[fanStarts, 0]
+    loopVerts[loopStarts + 1] = triangles[fanStarts, 1]
+    owners = np.repeat(np.arange(len(polygonSizes)), fanCounts)
+    loopVerts[loopStarts[owners] + 2 + np.arange(len(triangles)) - fanStarts[owners]] = triangles[:, 2]
+    return loopVerts, loopStarts, loopTotals
+
+
+def subdivideObject(ob, levels):
+    """ a new object holding the catmull-clark subdivision of ob's mesh, computed by the same
+    subdivision surface modifier the exporter left off the cage """
+    modifier = ob.modifiers.new("subsurf", 'SUBSURF')
+    modifier.subdivision_type = 'CATMULL_CLARK'
+    modifier.levels = levels
+    try:
+        subdividedMesh = ob.to_mesh(bpy.context.scene, True, 'PREVIEW')
+    finally:
+        ob.modifiers.remove(modifier)
+    return addToScene(subdividedMesh, ob.location)
+
+
+def canonicalMeshID(meshID):
+    # hack because of initial cube
+    if meshID == "Cube":
+        return "Cube-Alternate"
+    return meshID
+
+
+def readCoordinates(mesh):
+    """ (V, 3) float64 copy of the mesh vertex positions, fetched in a single foreach_get """
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    return coords.reshape(-1, 3).astype(np.float64)
+
+
+def writeCoordinates(mesh, coords):
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(coords, dtype=np.float32).ravel())
+
+
+def fetchChainMesh(bucketName, downloadCache=None):
     chainURL = "https://storage.googleapis.com/"+bucketName+"/models/necklace_chain.json"
-    response = urllib.request.urlopen(chainURL)
-    data = response.read()
+    data = fetchURL(chainURL, downloadCache)
     modelJSON = json.loads(data.decode('utf-8'))
-    return TroveMesh(modelJSON["meshes"][0])
+    return TroveMesh(modelJSON["meshes"][0], modelFormatVersion(modelJSON))
+
+
+def downloadChainMesh(bucketName, downloadCache=None):
+    tmesh = fetchChainMesh(bucketName, downloadCache)
+    tmesh.materialize()
+    return tmesh
 
 
 def addToScene(mesh, location=(0, 0, 0)):
@@ -220,7 +552,8 @@ def parseSize(size):
     parts = size.split("_")
     return parts[0], parts[1]
 
-def applyScale(obj, size, originalDiameter):
+def sizeScaleFactor(size, originalDiameter):
+    """ uniform scale taking a model of originalDiameter to the requested size, 1 for necklaces """
     sizeCategory, sizeValue = parseSize(size)
     targetDiameter = 1
 
@@ -230,7 +563,7 @@ def applyScale(obj, size, originalDiameter):
         # bracelet_1 maps to "Extra Small" which is 55mm, with 5mm increment between sizes
         targetDiameter = 5 * int(sizeValue) + 50
     elif sizeCategory == "necklace":
-        return
+        return 1
         # more consistent method but does unnecessary and expensive scaling operation
         # targetDiameter = originalDiameter
     else:
@@ -238,32 +571,608 @@ def applyScale(obj, size, originalDiameter):
 
     scaleFactor = targetDiameter / originalDiameter
     print("Desired diameter of {0}; scaling original diameter {1} up by a factor of {2}".format(targetDiameter, originalDiameter, scaleFactor))
+    return scaleFactor
 
-    for v in obj.data.vertices:
-        v.co = v.co * scaleFactor
 
+@traced("download")
+def fetchURL(url, downloadCache=None):
+    if downloadCache:
+        return downloadCache.fetch(url)
 
-def processExport(downloadURL, exportPath, size, visible, weights, enableRender, importBucket):
-    start = time.clock()
+    response = urllib.request.urlopen(url)
+    return response.read()
 
-    tModel = TroveModel()
-    tModel.importURL(downloadURL)
-    finalMesh = tModel.generateExportMesh(size, visible, weights, enableRender, importBucket)
-    exportOBJLite([finalMesh], exportPath, enableRender)
 
-    duration = start - time.clock()
-    return {"completed": True, "duration": duration, "fileName": exportPath}
+def fetchModel(url, downloadCache=None, preferBinary=False):
+    """ the model at url, mapped from the download cache rather than read when there is one. With
+    preferBinary a json model's binary companion is fetched instead wherever it exists and was
+    written from the json currently at url """
+    if preferBinary and url.endswith(".json"):
+        companion = fetchCompanion(url, downloadCache)
+        if companion is not None:
+            return companion
 
+    if downloadCache:
+        with traceSpan("download"):
+            return downloadCache.fetchMapped(url)
+    return fetchURL(url)
 
-# seems like modifier application affects active (unverified)
-# delete affects the selected object
+
+# what a bucket answers for an object that is not there, 403 rather than 404 when the caller may
+# not list the bucket
+MISSING_OBJECT_STATUSES = (403, 404)
+
+
+def fetchCompanion(url, downloadCache=None):
+    """ the binary companion of the json model at url, or None when there is none or it was written
+    from another version of the json than the one at url now, as when only the json was re-uploaded """
+    try:
+        companion = fetchModel(binaryCompanionURL(url), downloadCache)
+    except urllib.error.HTTPError as e:
+        if e.code not in MISSING_OBJECT_STATUSES:
+            raise
+        return None
+
+    header, dataStart = readBinaryHeader(companion)
+    sourceMD5 = downloadCache.fetchMD5(url) if downloadCache else remoteMD5(url)
+    if not sourceMD5 or header.get("sourceMD5") != sourceMD5:
+        print("Binary companion of {0} does not match the json, loading the json".format(url))
+        return None
+    return companion
+
+
+@traced("download")
+def remoteMD5(url):
+    """ hex MD5 of the object at url, from a HEAD request; None when the server does not report it """
+    response = urllib.request.urlopen(urllib.request.Request(url, method="HEAD"))
+    return responseMD5(response.headers)
+
+
+def responseMD5(headers):
+    """ the MD5 in GCS's x-goog-hash header, or the ETag when it is one, as for non-composite objects """
+    for value in headers.get_all("x-goog-hash") or []:
+        for part in value.split(","):
+            algorithm, separator, digest = part.strip().partition("=")
+            if algorithm == "md5":
+                return binascii.hexlify(base64.b64decode(digest)).decode("ascii")
+
+    etag = (headers.get("ETag") or "").strip('"').lower()
+    if len(etag) == 32 and all(c in "0123456789abcdef" for c in etag):
+        return etag
+    return None
+
+
+class NeedsBlender(Exception):
+    """ raised by export engines running outside blender for jobs only blender can do """
+    pass
+
+
+class ModelSource():
+    """ downloaded model bytes, parsed into a TroveModel only once something needs the geometry """
+    def __init__(self, modelBytes, digest=None):
+        self.modelBytes = modelBytes
+        self.digest = digest or hashlib.sha1(modelBytes).hexdigest()
+        self.tModel = None
+
+    def model(self):
+        if not self.tModel:
+            self.tModel = TroveModel()
+            self.tModel.importBytes(self.modelBytes)
+        return self.tModel
+
+    def exportMeshes(self, size, visible, weights, enableRender, importBucket, downloadCache=None):
+        """ the baked and combined visible meshes as unscaled export arrays, see collectExportArrays.
+        Leaves the model as it was found """
+        tModel = self.model()
+        keepObjects = set(bpy.data.objects.keys())
+        try:
+            combinedMesh = tModel.generateCombinedMesh(size, visible, weights, enableRender, importBucket, downloadCache)
+            return collectExportArrays([combinedMesh], enableRender)
+        finally:
+            # baking is destructive, put the model back and drop the job's scratch objects
+            with traceSpan("reset"):
+                tModel.resetMeshes()
+                removeObjectsExcept(keepObjects | tModel.blendObjectNames())
+
+
+# models a worker keeps parsed between jobs, least recently used first, so that jobs on the same
+# model skip parsing and rebake incrementally from the weights of the previous one
+loadedModels = OrderedDict()  # model digest => ModelSource
+MAX_LOADED_MODELS = 8
+
+
+def loadModelSource(modelBytes, sourceType=ModelSource):
+    """ the source for modelBytes, the one an earlier job already loaded when there is one """
+    digest = hashlib.sha1(modelBytes).hexdigest()
+    source = loadedModels.pop(digest, None)
+    if type(source) is not sourceType:
+        source = sourceType(modelBytes, digest)
+    loadedModels[digest] = source
+
+    while len(loadedModels) > MAX_LOADED_MODELS:
+        loadedModels.popitem(last=False)
+    return source
+
+
+def loadedObjectNames():
+    """ blender objects of the loaded models, which outlive the job that created them """
+    names = set()
+    for source in loadedModels.values():
+        if source.tModel:
+            names |= source.tModel.blendObjectNames()
+    return names
+
+
+def exportFromSource(source, exportPath, size, visible, weights, enableRender, importBucket, cache=None, downloadCache=None, exportFormat="obj", stream=None):
+    """ export an already downloaded model to exportPath, or through stream (an ExportStream) when one
+    is given. The model is left as it was found so that it can serve further jobs """
+    return exportSizesFromSource(source, [exportPath], [size], visible, weights, enableRender, importBucket, cache, downloadCache, exportFormat, stream)[0]
+
+
+def exportSizesFromSource(source, exportPaths, sizes, visible, weights, enableRender, importBucket, cache=None, downloadCache=None, exportFormat="obj", stream=None):
+    """ export one design at several sizes of the same category, one file per size. Sizing is only
+    a uniform scale (plus the ground offset for renders), so the meshes are combined once and each
+    size is scaled from a copy of the combined arrays as it is written """
+    start = time.perf_counter()
+
+    # before any output is opened, a bad format must not leave empty files behind
+    checkExportFormat(exportFormat)
+    categories = set(parseSize(size)[0] for size in sizes)
+    if len(categories) != 1:
+        raise Exception("Error: sizes exported together must share a category, got {0}".format(sizes))
+
+    # no visible list means the model's defaults, sharing cache entries with the same list given explicitly
+    if cache and not visible:
+        visible = source.model().getDefaultVisible()
+
+    results = [None] * len(sizes)
+    cacheKeys = [None] * len(sizes)
+    for i, size in enumerate(sizes):
+        if not cache:
+            continue
+        cacheKeys[i] = cache.makeKey(source.digest, size, visible, weights, enableRender, exportFormat)
+        cached = cache.lookup(cacheKeys[i])
+        if cached is not None:
+            stats, entryFile = cached
+            out = openExportOutput(exportPaths[i], stream, stats)
+            cache.copyTo(cacheKeys[i], entryFile, out)
+            out.close()
+
+            duration = time.perf_counter() - start
+            results[i] = {"completed": True, "duration": duration, "fileName": exportPaths[i], "cache": "hit"}
+            results[i].update(stats)
+
+    if all(results):
+        return results
+
+    exportMeshes = source.exportMeshes(sizes[0], visible, weights, enableRender, importBucket, downloadCache)
+    tModel = source.model()
+    for coords, triangles, smooth, loopNormals in exportMeshes:
+        traceCount("vertices", len(coords))
+        traceCount("triangles", len(triangles))
+
+    for i, size in enumerate(sizes):
+        if results[i]:
+            continue
+
+        # rendered models also get set down onto the ground plane
+        sizedMeshes = scaleExportArrays(exportMeshes, sizeScaleFactor(size, tModel.diameter), enableRender)
+        stats = {"format": exportFormat, "triangleCount": sum(len(triangles) for coords, triangles, smooth, loopNormals in sizedMeshes)}
+
+        out = openExportOutput(exportPaths[i], stream, stats)
+        entryFile = None
+        if cache:
+            entryFile = cache.openEntry(cacheKeys[i])
+            out.sinks.append(entryFile)
+        try:
+            writeExport(out, sizedMeshes, exportFormat)
+        except:
+            out.abort()
+            if cache:
+                cache.discardEntry(entryFile)
+            raise
+        out.close()
+        stats["byteSize"] = out.bytesWritten
+
+        if cache:
+            cache.commitEntry(cacheKeys[i], entryFile, stats)
+
+        duration = time.perf_counter() - start
+        results[i] = {"completed": True, "duration": duration, "fileName": exportPaths[i], "cache": "miss" if cache else "disabled"}
+        results[i].update(stats)
+
+    return results
+
+
+@traced("scale")
+def scaleExportArrays(exportMeshes, scaleFactor, ground=False):
+    """ copies of export arrays scaled about the origin and, with ground, rested on y = 0 as a whole;
+    normals are unaffected by a uniform scale and shared with the originals """
+    offset = 0
+    if ground:
+        offset = max(groundOffset(coords, scaleFactor) for coords, triangles, smooth, loopNormals in exportMeshes)
+
+    sizedMeshes = []
+    for coords, triangles, smooth, loopNormals in exportMeshes:
+        # scaled in float64 and stored back as float32, as blender keeps mesh coordinates
+        sized = coords.astype(np.float64) * scaleFactor
+        sized[:, 1] += offset
+        sizedMeshes.append((sized.astype(np.float32), triangles, smooth, loopNormals))
+    return sizedMeshes
+
+
+class ExportCache():
+    """ content-addressed store of finished export files on local disk, keyed on everything that
+    determines the output, and trimmed least-recently-used first once it outgrows maxBytes """
+    def __init__(self, cacheDir, maxBytes=512 * 1024 * 1024, weightPrecision=0.001):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.weightPrecision = weightPrecision
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def makeKey(self, modelDigest, size, visible, weights, enableRender, exportFormat="obj"):
+        # weights within weightPrecision of each other share an entry
+        quantized = {}
+        for operatorID, value in weights.items():
+            quantized[operatorID] = int(round(value / self.weightPrecision))
+
+        keyData = {
+            "model": modelDigest,
+            "size": size,
+            "visible": sorted(visible or []),
+            "weights": quantized,
+            "enableRender": bool(enableRender),
+            "format": exportFormat
+        }
+        return hashlib.sha1(json.dumps(keyData, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def entryPath(self, key):
+        return os.path.join(self.cacheDir, key)
+
+    def lookup(self, key):
+        """ the stats stored with a cached result and the entry opened for copyTo, or None on a
+        miss. The open entry stays readable should another worker evict it in the meantime """
+        entry = self.entryPath(key)
+        try:
+            entryFile = open(entry, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            with open(entry + ".meta", "r") as f:
+                return json.loads(f.read()), entryFile
+        except (IOError, OSError, ValueError):
+            entryFile.close()
+            return None
+
+    def copyTo(self, key, entryFile, out):
+        with entryFile:
+            shutil.copyfileobj(entryFile, out, EXPORT_FRAME_BYTES)
+
+        # mtime doubles as the recency stamp for eviction, an entry evicted since lookup is gone
+        try:
+            os.utime(self.entryPath(key), None)
+        except FileNotFoundError:
+            pass
+
+    def openEntry(self, key):
+        """ file to write a new entry into, invisible to lookups until commitEntry. Each gets a
+        .partial of its own, workers sharing the cache may be exporting the same key at once """
+        return tempfile.NamedTemporaryFile(suffix=".partial", dir=self.cacheDir, delete=False)
+
+    def discardEntry(self, entryFile):
+        """ drop the file openEntry started for an export that failed, eviction never sees partial files """
+        entryFile.close()
+        removeIfPresent(entryFile.name)
+
+    def commitEntry(self, key, entryFile, stats):
+        entry = self.entryPath(key)
+        os.replace(entryFile.name, entry)
+        replaceFile(entry + ".meta", json.dumps(stats).encode("utf-8"))
+        evictLeastRecent(self.cacheDir, self.maxBytes)
+
+
+# streamed exports are cut into frames of at most this size
+EXPORT_FRAME_BYTES = 256 * 1024
+# frame length announcing that the export failed and what was sent should be discarded
+EXPORT_FRAME_ABORT = 0xFFFFFFFF
+
+
+class ExportOutput():
+    """ fans the bytes of an export out to any number of binary sinks, counting them on the way """
+    def __init__(self, sinks):
+        self.sinks = sinks
+        self.bytesWritten = 0
+
+    def write(self, data):
+        for sink in self.sinks:
+            sink.write(data)
+        self.bytesWritten += len(data)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def abort(self):
+        for sink in self.sinks:
+            if hasattr(sink, "abort"):
+                sink.abort()
+            else:
+                sink.close()
+
+
+class ExportStream():
+    """ a pipe or inherited file descriptor the caller reads exports from while they are written.
+    Each export is a sequence of frames, a little-endian uint32 length followed by that many bytes:
+    one JSON header frame with the result metadata, data frames, then an empty frame to finish or
+    an EXPORT_FRAME_ABORT length (with no payload) if the export failed part way """
+    def __init__(self, fh, header, closeWhenDone=False):
+        self.fh = fh
+        self.header = header
+        self.closeWhenDone = closeWhenDone
+
+    def begin(self, stats):
+        header = dict(self.header)
+        header.update(stats)
+        return FramedWriter(self, header)
+
+
+class FramedWriter():
+    def __init__(self, stream, header):
+        self.stream = stream
+        self.pending = []
+        self.pendingBytes = 0
+        self.writeFrame(json.dumps(header).encode('utf-8'))
+
+    def writeFrame(self, data):
+        self.stream.fh.write(struct.pack("<I", len(data)))
+        self.stream.fh.write(data)
+
+    def write(self, data):
+        self.pending.append(data)
+        self.pendingBytes += len(data)
+        if self.pendingBytes >= EXPORT_FRAME_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self.pendingBytes:
+            self.writeFrame(b"".join(self.pending))
+            self.pending = []
+            self.pendingBytes = 0
+        self.stream.fh.flush()
+
+    def close(self):
+        self.flush()
+        self.writeFrame(b"")
+        self.finish()
+
+    def abort(self):
+        self.stream.fh.write(struct.pack("<I", EXPORT_FRAME_ABORT))
+        self.finish()
+
+    def finish(self):
+        self.stream.fh.flush()
+        if self.stream.closeWhenDone:
+            self.stream.fh.close()
+
+
+def openExportOutput(exportPath, stream, stats):
+    if stream:
+        return ExportOutput([stream.begin(stats)])
+    return ExportOutput([open(exportPath, "wb")])
+
+
+def openExportStream(opts):
+    """ the ExportStream requested by an invocation, either an inherited descriptor number in
+    outputFD (left open for following jobs) or the path of a named pipe in outputPipe """
+    header = {"jobID": opts.get("jobID")}
+    if opts.get("outputFD") is not None:
+        return ExportStream(os.fdopen(opts["outputFD"], "wb", closefd=False), header)
+    if opts.get("outputPipe"):
+        return ExportStream(open(opts["outputPipe"], "wb"), header, closeWhenDone=True)
+    return None
+
+
+class DownloadCache():
+    """ local copies of downloaded models, revalidated with conditional GETs against their
+    ETag/Last-Modified, or trusted outright while younger than maxAge seconds. Models found missing
+    are remembered the same way, so are the MD5s fetchMD5 asks for """
+    def __init__(self, cacheDir, maxBytes=256 * 1024 * 1024, maxAge=0):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.maxAge = maxAge
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def entryPaths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cacheDir, key)
+        return base + ".body", base + ".meta"
+
+    def fetch(self, url):
+        with open(self.fetchPath(url), "rb") as f:
+            return f.read()
+
+    def fetchMapped(self, url):
+        """ fetch, as a read only memory map of the cached copy """
+        return mapFile(self.fetchPath(url))
+
+    def fetchPath(self, url):
+        """ bring the cached copy of url up to date and return its path """
+        bodyPath, metaPath = self.entryPaths(url)
+        meta = self.readMeta(metaPath)
+        fresh = meta and self.maxAge and time.time() - meta["validated"] < self.maxAge
+        if meta and meta.get("missing"):
+            if fresh:
+                raise urllib.error.HTTPError(url, meta["missing"], "Missing when last asked", None, None)
+            meta = None
+        elif meta and not os.path.exists(bodyPath):
+            meta = None
+        elif fresh:
+            return self.touchBody(bodyPath)
+
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("lastModified"):
+            headers["If-Modified-Since"] = meta["lastModified"]
+
+        try:
+            response = urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+        except urllib.error.HTTPError as e:
+            if e.code in MISSING_OBJECT_STATUSES:
+                # a missing companion is asked for again only once maxAge has passed
+                self.writeMeta(metaPath, {"url": url, "missing": e.code, "validated": time.time()})
+                removeIfPresent(bodyPath)
+                raise
+            if e.code != 304 or not meta:
+                raise
+            # not modified, our copy is good for another maxAge
+            meta["validated"] = time.time()
+            self.writeMeta(metaPath, meta)
+            return self.touchBody(bodyPath)
+
+        replaceFile(bodyPath, response.read())
+        self.writeMeta(metaPath, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "lastModified": response.headers.get("Last-Modified"),
+            "validated": time.time()
+        })
+
+        # the new entry is the most recent, it only goes if it alone is larger than maxBytes
+        evictLeastRecent(self.cacheDir, self.maxBytes)
+        return bodyPath
+
+    def fetchMD5(self, url):
+        """ remoteMD5 of url, asked again only once maxAge has passed """
+        metaPath = self.entryPaths("HEAD " + url)[1]
+        meta = self.readMeta(metaPath)
+        if meta and self.maxAge and time.time() - meta["validated"] < self.maxAge:
+            return meta["md5"]
+
+        md5 = remoteMD5(url)
+        self.writeMeta(metaPath, {"url": url, "md5": md5, "validated": time.time()})
+        return md5
+
+    def touchBody(self, bodyPath):
+        os.utime(bodyPath, None)
+        return bodyPath
+
+    def readMeta(self, metaPath):
+        """ the meta of an entry, None when there is none or it cannot be read, making a miss """
+        try:
+            with open(metaPath, "r") as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def writeMeta(self, metaPath, meta):
+        replaceFile(metaPath, json.dumps(meta).encode("utf-8"))
+
+
+def replaceFile(path, data):
+    """ write data to path through a uniquely named .partial file in the same directory, so that
+    readers and concurrent writers only ever see a complete file """
+    fd, partial = tempfile.mkstemp(suffix=".partial", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def evictLeastRecent(cacheDir, maxBytes):
+    """ delete the least recently used entries of a cache directory until it fits in maxBytes;
+    files sharing a name up to the first dot belong to the same entry """
+    entries = {}  # entry name => [newest mtime, total size, file names]
+    totalBytes = 0
+    for name in os.listdir(cacheDir):
+        if name.endswith(".partial"):
+            continue
+        try:
+            stat = os.stat(os.path.join(cacheDir, name))
+        except FileNotFoundError:
+            # evicted or replaced by another worker since listdir
+            continue
+        entry = entries.setdefault(name.split(".")[0], [0, 0, []])
+        entry[0] = max(entry[0], stat.st_mtime)
+        entry[1] += stat.st_size
+        entry[2].append(name)
+        totalBytes += stat.st_size
+
+    for mtime, entryBytes, names in sorted(entries.values()):
+        if totalBytes <= maxBytes:
+            break
+        for name in names:
+            removeIfPresent(os.path.join(cacheDir, name))
+        totalBytes -= entryBytes
+
+
+def removeIfPresent(path):
+    """ remove path unless another worker sharing the cache directory got to it first """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+exportCaches = {}  # cacheDir => ExportCache, shared by every job a worker runs
+downloadCaches = {}  # cacheDir => DownloadCache
+
+
+def getExportCache(cacheOpts):
+    if not cacheOpts:
+        return None
+
+    cacheDir = os.path.abspath(cacheOpts["dir"])
+    if cacheDir not in exportCaches:
+        exportCaches[cacheDir] = ExportCache(cacheDir)
+
+    cache = exportCaches[cacheDir]
+    cache.maxBytes = cacheOpts.get("maxBytes", cache.maxBytes)
+    cache.weightPrecision = cacheOpts.get("weightPrecision", cache.weightPrecision)
+    return cache
+
+
+def getDownloadCache(cacheOpts):
+    if not cacheOpts:
+        return None
+
+    cacheDir = os.path.abspath(cacheOpts["dir"])
+    if cacheDir not in downloadCaches:
+        downloadCaches[cacheDir] = DownloadCache(cacheDir)
+
+    cache = downloadCaches[cacheDir]
+    cache.maxBytes = cacheOpts.get("maxBytes", cache.maxBytes)
+    cache.maxAge = cacheOpts.get("maxAge", cache.maxAge)
+    return cache
+
+
+@traced("union")
 def combineObjects(objects):
+    """ merge the objects into one, running the (slow) boolean union only among objects whose
+    surfaces come close enough to possibly intersect and concatenating the separate pieces """
     if len(objects) == 0:
         return None
 
     if len(objects) == 1:
         return objects[0]
 
+    bounds = [objectFaceBounds(ob) for ob in objects]
+    parts = [unionObjects([objects[i] for i in cluster]) for cluster in overlapClusters(bounds)]
+
+    if len(parts) == 1:
+        return parts[0]
+    return concatenateObjects(parts)
+
+
+# seems like modifier application affects active (unverified)
+# delete affects the selected object
+def unionObjects(objects):
+    if len(objects) == 1:
+        return objects[0]
+
     unionMesh = bpy.data.meshes.new("union")
     unionObject = bpy.data.objects.new("union", unionMesh)
 
@@ -284,6 +1193,181 @@ def combineObjects(objects):
     return unionObject
 
 
+def objectPolygonArrays(ob):
+    """ world space (V, 3) coordinates plus the loop vertex indices, loop starts and loop totals of
+    an object's polygons, which need not be triangles after a boolean """
+    me = ob.data
+    coords = readCoordinates(me)
+    matrix = np.array(ob.matrix_world, dtype=np.float64)
+    coords = coords.dot(matrix[:3, :3].T) + matrix[:3, 3]
+
+    loopVerts = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", loopVerts)
+    loopStarts = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_start", loopStarts)
+    loopTotals = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_total", loopTotals)
+    return coords, loopVerts, loopStarts, loopTotals
+
+
+def objectFaceBounds(ob):
+    coords, loopVerts, loopStarts, loopTotals = objectPolygonArrays(ob)
+    return faceBounds(coords, loopVerts, loopStarts)
+
+
+def faceBounds(coords, loopVerts, loopStarts):
+    """ (F, 3) minimum and maximum corners of each face's bounding box """
+    if not len(loopStarts):
+        empty = np.empty((0, 3))
+        return empty, empty
+
+    # reduceat wants the faces in loop order, which they nearly always already are
+    order = np.argsort(loopStarts, kind="mergesort")
+    loopCoords = coords[loopVerts]
+    faceMin = np.empty((len(loopStarts), 3))
+    faceMax = np.empty((len(loopStarts), 3))
+    faceMin[order] = np.minimum.reduceat(loopCoords, loopStarts[order], axis=0)
+    faceMax[order] = np.maximum.reduceat(loopCoords, loopStarts[order], axis=0)
+    return faceMin, faceMax
+
+
+# distance under which surfaces are treated as touching
+OVERLAP_EPSILON = 1e-5
+# past this many candidate face pairs just assume the meshes intersect
+OVERLAP_MAX_PAIRS = 4000000
+
+
+def overlapClusters(bounds):
+    """ group meshes, given as (faceMin, faceMax) pairs, into connected clusters of possibly
+    intersecting meshes. Returns lists of mesh indices, each cluster ordered as given """
+    parents = list(range(len(bounds)))
+
+    def root(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for i in range(len(bounds)):
+        for j in range(i + 1, len(bounds)):
+            if root(i) != root(j) and meshesOverlap(bounds[i], bounds[j]):
+                parents[root(j)] = root(i)
+
+    clusters = OrderedDict()
+    for i in range(len(bounds)):
+        clusters.setdefault(root(i), []).append(i)
+    return list(clusters.values())
+
+
+def meshesOverlap(boundsA, boundsB):
+    """ conservative intersection test: an overall bounding box check, then a spatial hash of the
+    face bounding boxes near the shared region. False means the surfaces are certainly apart;
+    nested meshes whose surfaces never meet still count as overlapping """
+    faceMinA, faceMaxA = boundsA
+    faceMinB, faceMaxB = boundsB
+    if not len(faceMinA) or not len(faceMinB):
+        return False
+
+    boxMinA, boxMaxA = faceMinA.min(axis=0), faceMaxA.max(axis=0)
+    boxMinB, boxMaxB = faceMinB.min(axis=0), faceMaxB.max(axis=0)
+    sharedMin = np.maximum(boxMinA, boxMinB) - OVERLAP_EPSILON
+    sharedMax = np.minimum(boxMaxA, boxMaxB) + OVERLAP_EPSILON
+    if np.any(sharedMin > sharedMax):
+        return False
+
+    # one box inside the other, the meshes could be nested without touching, let the boolean decide
+    if np.all(boxMinA <= boxMinB) and np.all(boxMaxA >= boxMaxB):
+        return True
+    if np.all(boxMinB <= boxMinA) and np.all(boxMaxB >= boxMaxA):
+        return True
+
+    # only faces reaching into the shared region can intersect
+    nearA = np.all((faceMaxA >= sharedMin) & (faceMinA <= sharedMax), axis=1)
+    nearB = np.all((faceMaxB >= sharedMin) & (faceMinB <= sharedMax), axis=1)
+    if not nearA.any() or not nearB.any():
+        return False
+    faceMinA, faceMaxA = faceMinA[nearA] - OVERLAP_EPSILON, faceMaxA[nearA] + OVERLAP_EPSILON
+    faceMinB, faceMaxB = faceMinB[nearB], faceMaxB[nearB]
+
+    # cells as large as the largest face, so a face spans at most two cells per axis
+    cellSize = max((faceMaxA - faceMinA).max(), (faceMaxB - faceMinB).max(), OVERLAP_EPSILON)
+    gridSize = np.floor((sharedMax - sharedMin) / cellSize).astype(np.int64) + 3
+    cellsA, facesA = spatialHash(faceMinA, faceMaxA, sharedMin, cellSize, gridSize)
+    cellsB, facesB = spatialHash(faceMinB, faceMaxB, sharedMin, cellSize, gridSize)
+
+    # pair up every A face with every B face in the same cell
+    orderB = np.argsort(cellsB, kind="mergesort")
+    cellsB, facesB = cellsB[orderB], facesB[orderB]
+    firstB = np.searchsorted(cellsB, cellsA, side="left")
+    countB = np.searchsorted(cellsB, cellsA, side="right") - firstB
+    numPairs = int(countB.sum())
+    if numPairs == 0:
+        return False
+    if numPairs > OVERLAP_MAX_PAIRS:
+        return True
+
+    pairA = np.repeat(facesA, countB)
+    pairStarts = np.repeat(np.cumsum(countB) - countB, countB)
+    pairB = facesB[np.repeat(firstB, countB) + np.arange(numPairs) - pairStarts]
+
+    touching = np.all((faceMaxA[pairA] >= faceMinB[pairB]) & (faceMinA[pairA] <= faceMaxB[pairB]), axis=1)
+    return bool(touching.any())
+
+
+def spatialHash(faceMin, faceMax, origin, cellSize, gridSize):
+    """ (cell key, face index) pairs for every grid cell each face bounding box touches. Faces
+    reach at most one cell outside the gridSize - 2 cells counted from origin, hence the shift """
+    cellMin = np.floor((faceMin - origin) / cellSize).astype(np.int64) + 1
+    cellMax = np.floor((faceMax - origin) / cellSize).astype(np.int64) + 1
+    faceIndex = np.arange(len(faceMin))
+
+    cellBlocks = []
+    faceBlocks = []
+    for offset in np.ndindex(2, 2, 2):
+        cell = cellMin + offset
+        inside = np.all(cell <= cellMax, axis=1)
+        cell = cell[inside]
+        cellBlocks.append((cell[:, 0] * gridSize[1] + cell[:, 1]) * gridSize[2] + cell[:, 2])
+        faceBlocks.append(faceIndex[inside])
+    return np.concatenate(cellBlocks), np.concatenate(faceBlocks)
+
+
+def concatenateObjects(objects):
+    """ a new object whose mesh simply holds all the polygons of the given objects, in world space """
+    coordBlocks = []
+    loopBlocks = []
+    startBlocks = []
+    totalBlocks = []
+    smoothBlocks = []
+    vertexOffset = loopOffset = 0
+    for ob in objects:
+        coords, loopVerts, loopStarts, loopTotals = objectPolygonArrays(ob)
+        smooth = np.empty(len(ob.data.polygons), dtype=bool)
+        ob.data.polygons.foreach_get("use_smooth", smooth)
+
+        coordBlocks.append(coords)
+        loopBlocks.append(loopVerts + vertexOffset)
+        startBlocks.append(loopStarts + loopOffset)
+        totalBlocks.append(loopTotals)
+        smoothBlocks.append(smooth)
+        vertexOffset += len(coords)
+        loopOffset += len(loopVerts)
+
+    joinedMesh = bpy.data.meshes.new("joined")
+    joinedMesh.vertices.add(vertexOffset)
+    joinedMesh.vertices.foreach_set("co", np.concatenate(coordBlocks).astype(np.float32).ravel())
+    joinedMesh.loops.add(loopOffset)
+    joinedMesh.loops.foreach_set("vertex_index", np.concatenate(loopBlocks))
+    numPolygons = sum(len(starts) for starts in startBlocks)
+    joinedMesh.polygons.add(numPolygons)
+    joinedMesh.polygons.foreach_set("loop_start", np.concatenate(startBlocks))
+    joinedMesh.polygons.foreach_set("loop_total", np.concatenate(totalBlocks))
+    joinedMesh.polygons.foreach_set("use_smooth", np.concatenate(smoothBlocks))
+    joinedMesh.update(calc_edges=True, calc_tessface=True)
+
+    return addToScene(joinedMesh)
+
+
 def selectOnly(obj=None):
     for ob in bpy.context.scene.objects:
         ob.select = False
@@ -295,315 +1379,259 @@ def selectOnly(obj=None):
     bpy.context.scene.objects.active = obj
 
 
-def name_compat(name):
-    if name is None:
-        return 'None'
+# rows per formatting block, keeps the temporary strings of huge meshes bounded
+OBJ_BLOCK_ROWS = 65536
+
+
+def writeRows(fh, lineTemplate, rows):
+    """ format a 2d array one block at a time with a single % per block instead of one per line """
+    for start in range(0, len(rows), OBJ_BLOCK_ROWS):
+        block = rows[start:start + OBJ_BLOCK_ROWS]
+        fh.write(((lineTemplate * len(block)) % tuple(block.ravel().tolist())).encode("ascii"))
+
+
+def dedupeNormals(loopNormals):
+    """ round float32 loop normals to 4 places like round(x, 4) and number the distinct ones in
+    order of first appearance, returning (unique rounded normals, per-loop normal index) """
+    # a float32 times 10000 is exact in float64, so rint (half to even) picks the same neighbour as
+    # round(x, 4) and the division back gives the same double, signed zeros included
+    steps = np.rint(np.asarray(loopNormals, dtype=np.float32).astype(np.float64) * 10000)
+    rounded = steps / 10000
+
+    # adding zero folds -0.0 into 0.0, which compare equal as dict keys too. Rows are compared as
+    # opaque 24 byte values, the numpy blender bundles has no np.unique(axis=0)
+    keys = np.ascontiguousarray(steps + 0.0).view(np.dtype((np.void, steps.dtype.itemsize * 3))).ravel()
+    unique, firstSeen, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(firstSeen)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rounded[firstSeen[order]], rank[inverse.ravel()]
+
+
+def writeOBJ(fh, coords, triangles, smooth, loopNormals=None, vertexOffset=1, normalOffset=1):
+    """ write one triangle-only, uv-less, material-less mesh: its vertices, its distinct normals
+    (when loopNormals is given), then the flat faces and the smooth ones, each group in mesh order
+    under its own "s off" / "s 1" line. triangles are (F, 3) vertex indices whose loops are numbered 3 * face + corner,
+    smooth is the per-face use_smooth flag. Returns the number of vertices and normals written """
+    writeRows(fh, "v %.6f %.6f %.6f\n", coords)
+
+    numFaces = len(triangles)
+    # faces grouped by smoothing, stable so each group keeps mesh order
+    faceOrder = np.argsort(smooth, kind="mergesort")
+    faceVerts = triangles[faceOrder] + vertexOffset
+
+    numNormals = 0
+    if loopNormals is not None:
+        sortedLoops = loopNormals.reshape(numFaces, 3, 3)[faceOrder].reshape(-1, 3)
+        uniqueNormals, normalIndex = dedupeNormals(sortedLoops)
+        numNormals = len(uniqueNormals)
+        writeRows(fh, "vn %.6f %.6f %.6f\n", uniqueNormals)
+
+        faceRows = np.empty((numFaces, 6), dtype=np.int64)
+        faceRows[:, 0::2] = faceVerts
+        faceRows[:, 1::2] = normalIndex.reshape(-1, 3) + normalOffset
+        faceTemplate = "f %d//%d %d//%d %d//%d\n"
     else:
-        return name.replace(' ', '_')
+        faceRows = faceVerts
+        faceTemplate = "f %d %d %d\n"
+
+    smoothSorted = smooth[faceOrder]
+    numFlat = numFaces - int(np.count_nonzero(smoothSorted))
+    if numFlat:
+        fh.write(b"s off\n")
+        writeRows(fh, faceTemplate, faceRows[:numFlat])
+    if numFlat < numFaces:
+        fh.write(b"s 1\n")
+        writeRows(fh, faceTemplate, faceRows[numFlat:])
+
+    return len(coords), numNormals
+
+
+def meshTriangleArrays(me):
+    """ (V, 3) coordinates, (F, 3) triangle vertex indices and (F,) use_smooth of a triangulated mesh """
+    coords = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", coords)
+
+    loopVerts = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", loopVerts)
+    loopStarts = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_start", loopStarts)
+    smooth = np.empty(len(me.polygons), dtype=bool)
+    me.polygons.foreach_get("use_smooth", smooth)
+
+    triangleLoops = loopStarts[:, None] + np.arange(3, dtype=np.int32)
+    return coords.reshape(-1, 3), loopVerts[triangleLoops], smooth, triangleLoops
+
+
+def extractExportArrays(ob, enableNormals):
+    """ world space, triangulated copy of an object's mesh as numpy arrays:
+    (coords, triangles, smooth, loopNormals), loopNormals being None unless requested """
+    with traceSpan("extract"):
+        me = ob.to_mesh(bpy.context.scene, False, 'PREVIEW')
+        me.transform(ob.matrix_world)
+        mesh_triangulate(me)
+
+    coords, triangles, smooth, triangleLoops = meshTriangleArrays(me)
+    bpy.data.meshes.remove(me)
+
+    # smooth shading all over, what calc_normals_split gives once every polygon has use_smooth
+    loopNormals = None
+    if enableNormals and len(triangles):
+        with traceSpan("normals"):
+            smooth = np.ones(len(triangles), dtype=bool)
+            loopNormals = smoothVertexNormals(coords, triangles)[triangles.ravel()]
+    return coords, triangles, smooth, loopNormals
+
+
+def collectExportArrays(objects, enableRender):
+    """ extractExportArrays for each object that has any geometry """
+    exportMeshes = []
+    for ob in objects:
+        arrays = extractExportArrays(ob, enableRender)
+        coords, triangles, smooth, loopNormals = arrays
+        if len(triangles) + len(coords):
+            exportMeshes.append(arrays)
+    return exportMeshes
 
 
-def veckey3d(v):
-    return round(v.x, 4), round(v.y, 4), round(v.z, 4)
+EXPORT_FORMATS = ("obj", "stl", "ply")
 
 
-def veckey2d(v):
-    return round(v[0], 4), round(v[1], 4)
+def checkExportFormat(exportFormat):
+    if exportFormat not in EXPORT_FORMATS:
+        raise Exception("Error: unknown export format {0}, expected one of {1}".format(exportFormat, EXPORT_FORMATS))
 
 
-def exportOBJLite(objects, exportPath, enableRender):
-    fh = open(exportPath, "w")
-    fw = fh.write
+@traced("write")
+def writeExport(out, exportMeshes, exportFormat="obj"):
+    """ write (coords, triangles, smooth, loopNormals) meshes to a binary stream in the requested format """
+    checkExportFormat(exportFormat)
 
-    EXPORT_GLOBAL_MATRIX = mathutils.Matrix()
-    EXPORT_NORMALS = enableRender
-    EXPORT_SMOOTH_GROUPS = enableRender
-    EXPORT_APPLY_MODIFIERS = False
+    if exportFormat == "obj":
+        writeExportOBJ(out, exportMeshes)
+        return
 
-    EXPORT_SMOOTH_GROUPS_BITFLAGS = False
-    EXPORT_KEEP_VERT_ORDER = False
-    EXPORT_BLEN_OBS = False
-    EXPORT_GROUP_BY_OB = False
-    EXPORT_POLYGROUPS = False
-    EXPORT_GROUP_BY_MAT = False
-    EXPORT_MTL = False
+    # binary formats take a single mesh, fold the objects together; no meshes make an empty one
+    coordBlocks = [np.zeros((0, 3), dtype=np.float32)]
+    triangleBlocks = [np.zeros((0, 3), dtype=np.int32)]
+    vertexOffset = 0
+    for coords, triangles, smooth, loopNormals in exportMeshes:
+        coordBlocks.append(coords)
+        triangleBlocks.append(triangles + vertexOffset)
+        vertexOffset += len(coords)
+
+    coords = np.concatenate(coordBlocks)
+    triangles = np.concatenate(triangleBlocks)
+    if exportFormat == "stl":
+        writeSTL(out, coords, triangles)
+    else:
+        writePLY(out, coords, triangles)
+
+
+def writeExportOBJ(out, exportMeshes):
+    """ the export meshes as one obj, plain meshes without uvs or materials, triangulated before
+    writing, with vertex and normal numbers running on across meshes """
+    vertexOffset = normalOffset = 1
+    for coords, triangles, smooth, loopNormals in exportMeshes:
+        numVerts, numNormals = writeOBJ(out, coords, triangles, smooth, loopNormals, vertexOffset, normalOffset)
+        vertexOffset += numVerts
+        normalOffset += numNormals
 
-    mtl_dict = {}
-    mtl_rev_dict = {}
 
-    # Initialize totals, these are updated each object
-    totverts = totuvco = totno = 1
+STL_TRIANGLE = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attributes", "<u2")])
+PLY_FACE = np.dtype([("count", "u1"), ("vertices", "<i4", (3,))])
 
-    face_vert_index = 1
-    scene = bpy.context.scene
 
-    for i, ob_main in enumerate(objects):
-        # ignore dupli children
-        if ob_main.parent and ob_main.parent.dupli_type in {'VERTS', 'FACES'}:
-            # XXX
-            continue
+def faceNormals(coords, triangles):
+    """ unit normals of each triangle following its winding, zero for degenerate ones """
+    corners = coords[triangles].astype(np.float64)
+    return unitRows(crossRows(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]))
 
-        obs = []
-        if ob_main.dupli_type != 'NONE':
-            # XXX
-            print('creating dupli_list on', ob_main.name)
-            ob_main.dupli_list_create(scene)
 
-            obs = [(dob.object, dob.matrix) for dob in ob_main.dupli_list]
+def crossRows(a, b):
+    """ np.cross of (..., 3) arrays, spelled out because np.cross is several times slower on these """
+    cross = np.empty(np.broadcast(a, b).shape, dtype=np.result_type(a, b))
+    cross[..., 0] = a[..., 1] * b[..., 2] - a[..., 2] * b[..., 1]
+    cross[..., 1] = a[..., 2] * b[..., 0] - a[..., 0] * b[..., 2]
+    cross[..., 2] = a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+    return cross
 
-            # XXX debug print
-            print(ob_main.name, 'has', len(obs), 'dupli children')
-        else:
-            obs = [(ob_main, ob_main.matrix_world)]
-        for ob, ob_mat in obs:
-            uv_unique_count = no_unique_count = 0
 
-            try:
-                me = ob.to_mesh(scene, EXPORT_APPLY_MODIFIERS, 'PREVIEW')
-            except RuntimeError:
-                me = None
+def dotRows(a, b):
+    """ row-wise dot products of (..., 3) arrays; summing an axis of 3 is slow in numpy """
+    return a[..., 0] * b[..., 0] + a[..., 1] * b[..., 1] + a[..., 2] * b[..., 2]
 
-            if me is None:
-                print("Not continuing execution")
-                continue
 
-            me.transform(EXPORT_GLOBAL_MATRIX * ob_mat)
+def unitRows(vectors):
+    """ (..., 3) vectors scaled to unit length, zero vectors left as they are """
+    lengths = np.sqrt(dotRows(vectors, vectors))
+    lengths[lengths == 0] = 1
+    return vectors / lengths[..., None]
 
-            # _must_ do this first since it re-allocs arrays
-            mesh_triangulate(me)
 
-            faceuv = False
+def smoothVertexNormals(coords, triangles):
+    """ (V, 3) float32 vertex normals the way blender computes them for smooth shading: unit face
+    normals summed with the corner angle as weight, falling back to the normalized position for
+    vertices without any, then stored as shorts """
+    corners = coords[triangles].astype(np.float64)
+    unitFaceNormals = faceNormals(coords, triangles)
 
-            me_verts = me.vertices[:]
+    # unit edge vectors leaving each corner towards the next, the angle at a corner lies between
+    # the edge arriving (the previous corner's) and the one leaving
+    edges = unitRows(np.roll(corners, -1, axis=1) - corners)
+    cosines = -dotRows(edges, np.roll(edges, 1, axis=1))
+    angles = np.arccos(np.clip(cosines, -1, 1))
 
-            face_index_pairs = [(face, index) for index, face in enumerate(me.polygons)]
+    # one bincount per axis sums the weighted face normals of every corner onto its vertex
+    cornerNormals = (unitFaceNormals[:, None, :] * angles[:, :, None]).reshape(-1, 3)
+    cornerVerts = triangles.ravel()
+    normals = np.empty((len(coords), 3))
+    for axis in range(3):
+        normals[:, axis] = np.bincount(cornerVerts, cornerNormals[:, axis], minlength=len(coords))
 
-            edges = []
-            if not (len(face_index_pairs) + len(edges) + len(me.vertices)):  # Make sure there is something to write
-                # clean up
-                bpy.data.meshes.remove(me)
-                continue  # dont bother with this mesh.
+    lengths = np.linalg.norm(normals, axis=1)
+    unused = lengths == 0
+    normals[unused] = coords[unused]
+    lengths[unused] = np.linalg.norm(normals[unused], axis=1)
+    lengths[lengths == 0] = 1
+    normals /= lengths[:, None]
 
-            if EXPORT_NORMALS and face_index_pairs:
-                for p in me.polygons:
-                        p.use_smooth = True
-                me.calc_normals_split()
-                # No need to call me.free_normals_split later, as this mesh is deleted anyway!
-                loops = me.loops
-            else:
-                loops = []
+    # MVert.no is a short vector, what comes back out of blender went through that truncation,
+    # which also turns every -0 into 0
+    return ((np.trunc(normals * 32767) + 0.0) / 32767).astype(np.float32)
 
-            EXPORT_SMOOTH_GROUPS = False # not sure if this is needed
-            if (EXPORT_SMOOTH_GROUPS or EXPORT_SMOOTH_GROUPS_BITFLAGS) and face_index_pairs:
-                smooth_groups, smooth_groups_tot = me.calc_smooth_groups(EXPORT_SMOOTH_GROUPS_BITFLAGS)
-                if smooth_groups_tot <= 1:
-                    smooth_groups, smooth_groups_tot = (), 0
-            else:
-                smooth_groups, smooth_groups_tot = (), 0
-            materials = me.materials[:]
-            material_names = [m.name if m else None for m in materials]
-
-            # avoid bad index errors
-            if not materials:
-                materials = [None]
-                material_names = [name_compat(None)]
-
-            # FIXME: won't need to sort by materials or texture, but verify smoothing
-            # Sort by Material, then images
-            # so we dont over context switch in the obj file.
-            if EXPORT_KEEP_VERT_ORDER:
-                pass
-            else:
-                if faceuv:
-                    if smooth_groups:
-                        sort_func = lambda a: (a[0].material_index,
-                                                hash(uv_texture[a[1]].image),
-                                                smooth_groups[a[1]] if a[0].use_smooth else False)
-                    else:
-                        sort_func = lambda a: (a[0].material_index,
-                                                hash(uv_texture[a[1]].image),
-                                                a[0].use_smooth)
-                elif len(materials) > 1:
-                    if smooth_groups:
-                        sort_func = lambda a: (a[0].material_index,
-                                                smooth_groups[a[1]] if a[0].use_smooth else False)
-                    else:
-                        sort_func = lambda a: (a[0].material_index,
-                                                a[0].use_smooth)
-                else:
-                    # no materials
-                    if smooth_groups:
-                        sort_func = lambda a: smooth_groups[a[1] if a[0].use_smooth else False]
-                    else:
-                        sort_func = lambda a: a[0].use_smooth
-
-                face_index_pairs.sort(key=sort_func)
-
-                del sort_func
-
-            # Set the default mat to no material and no image.
-            contextMat = 0, 0  # Can never be this, so we will label a new material the first chance we get.
-            contextSmooth = None  # Will either be true or false,  set bad to force initialization switch.
-
-            if EXPORT_BLEN_OBS or EXPORT_GROUP_BY_OB:
-                name1 = ob.name
-                name2 = ob.data.name
-                if name1 == name2:
-                    obnamestring = name_compat(name1)
-                else:
-                    obnamestring = '%s_%s' % (name_compat(name1), name_compat(name2))
-
-                if EXPORT_BLEN_OBS:
-                    fw('o %s\n' % obnamestring)  # Write Object name
-                else:  # if EXPORT_GROUP_BY_OB:
-                    fw('g %s\n' % obnamestring)
-
-            # Vert
-            for v in me_verts:
-                fw('v %.6f %.6f %.6f\n' % v.co[:])
-
-            # NORMAL, Smooth/Non smoothed.
-            if EXPORT_NORMALS:
-                no_key = no_val = None
-                normals_to_idx = {}
-                no_get = normals_to_idx.get
-                loops_to_normals = [0] * len(loops)
-                for f, f_index in face_index_pairs:
-                    for l_idx in f.loop_indices:
-                        no_key = veckey3d(loops[l_idx].normal)
-                        no_val = no_get(no_key)
-                        if no_val is None:
-                            no_val = normals_to_idx[no_key] = no_unique_count
-                            fw('vn %.6f %.6f %.6f\n' % no_key)
-                            no_unique_count += 1
-                        loops_to_normals[l_idx] = no_val
-                del normals_to_idx, no_get, no_key, no_val
-            else:
-                loops_to_normals = []
-
-            if not faceuv:
-                f_image = None
-
-            for f, f_index in face_index_pairs:
-                f_smooth = f.use_smooth
-                if f_smooth and smooth_groups:
-                    f_smooth = smooth_groups[f_index]
-                f_mat = min(f.material_index, len(materials) - 1)
-
-                if faceuv:
-                    tface = uv_texture[f_index]
-                    f_image = tface.image
-
-                # MAKE KEY
-                if faceuv and f_image:  # Object is always true.
-                    key = material_names[f_mat], f_image.name
-                else:
-                    key = material_names[f_mat], None  # No image, use None instead.
-
-                # Write the vertex group
-                if EXPORT_POLYGROUPS:
-                    if vertGroupNames:
-                        # find what vertext group the face belongs to
-                        vgroup_of_face = findVertexGroupName(f, vgroupsMap)
-                        if vgroup_of_face != currentVGroup:
-                            currentVGroup = vgroup_of_face
-                            fw('g %s\n' % vgroup_of_face)
-
-                # CHECK FOR CONTEXT SWITCH
-                if key == contextMat:
-                    pass  # Context already switched, dont do anything
-                else:
-                    if key[0] is None and key[1] is None:
-                        # Write a null material, since we know the context has changed.
-                        if EXPORT_GROUP_BY_MAT:
-                            # can be mat_image or (null)
-                            fw("g %s_%s\n" % (name_compat(ob.name), name_compat(ob.data.name)))
-                        if EXPORT_MTL:
-                            fw("usemtl (null)\n")  # mat, image
-
-                    else:
-                        mat_data = mtl_dict.get(key)
-                        if not mat_data:
-                            # First add to global dict so we can export to mtl
-                            # Then write mtl
-
-                            # Make a new names from the mat and image name,
-                            # converting any spaces to underscores with name_compat.
-
-                            # If none image dont bother adding it to the name
-                            # Try to avoid as much as possible adding texname (or other things)
-                            # to the mtl name (see [#32102])...
-                            mtl_name = "%s" % name_compat(key[0])
-                            if mtl_rev_dict.get(mtl_name, None) not in {key, None}:
-                                if key[1] is None:
-                                    tmp_ext = "_NONE"
-                                else:
-                                    tmp_ext = "_%s" % name_compat(key[1])
-                                i = 0
-                                while mtl_rev_dict.get(mtl_name + tmp_ext, None) not in {key, None}:
-                                    i += 1
-                                    tmp_ext = "_%3d" % i
-                                mtl_name += tmp_ext
-                            mat_data = mtl_dict[key] = mtl_name, materials[f_mat], f_image
-                            mtl_rev_dict[mtl_name] = key
-
-                        if EXPORT_GROUP_BY_MAT:
-                            # can be mat_image or (null)
-                            fw("g %s_%s_%s\n" % (name_compat(ob.name), name_compat(ob.data.name), mat_data[0]))
-                        if EXPORT_MTL:
-                            fw("usemtl %s\n" % mat_data[0])  # can be mat_image or (null)
-
-                contextMat = key
-                if f_smooth != contextSmooth:
-                    if f_smooth:  # on now off
-                        if smooth_groups:
-                            f_smooth = smooth_groups[f_index]
-                            fw('s %d\n' % f_smooth)
-                        else:
-                            fw('s 1\n')
-                    else:  # was off now on
-                        fw('s off\n')
-                    contextSmooth = f_smooth
-
-                f_v = [(vi, me_verts[v_idx], l_idx)
-                        for vi, (v_idx, l_idx) in enumerate(zip(f.vertices, f.loop_indices))]
-
-                fw('f')
-                if faceuv:
-                    if EXPORT_NORMALS:
-                        for vi, v, li in f_v:
-                            fw(" %d/%d/%d" % (totverts + v.index,
-                                                totuvco + uv_face_mapping[f_index][vi],
-                                                totno + loops_to_normals[li],
-                                                ))  # vert, uv, normal
-                    else:  # No Normals
-                        for vi, v, li in f_v:
-                            fw(" %d/%d" % (totverts + v.index,
-                                            totuvco + uv_face_mapping[f_index][vi],
-                                            ))  # vert, uv
-
-                    face_vert_index += len(f_v)
-
-                else:  # No UV's
-                    if EXPORT_NORMALS:
-                        for vi, v, li in f_v:
-                            fw(" %d//%d" % (totverts + v.index, totno + loops_to_normals[li]))
-                    else:  # No Normals
-                        for vi, v, li in f_v:
-                            fw(" %d" % (totverts + v.index))
-
-                fw('\n')
-
-            # Make the indices global rather then per mesh
-            totverts += len(me_verts)
-            totuvco += uv_unique_count
-            totno += no_unique_count
-
-            # clean up
-            bpy.data.meshes.remove(me)
-
-    if ob_main.dupli_type != 'NONE':
-        ob_main.dupli_list_clear()
-    fh.close()
+
+def writeSTL(fh, coords, triangles):
+    records = np.zeros(len(triangles), dtype=STL_TRIANGLE)
+    records["normal"] = faceNormals(coords, triangles)
+    records["vertices"] = coords[triangles]
+
+    header = b"Trove binary STL"
+    fh.write(header.ljust(80, b" "))
+    fh.write(np.array([len(triangles)], dtype="<u4").tobytes())
+    fh.write(records.tobytes())
+
+
+def writePLY(fh, coords, triangles):
+    header = "\n".join([
+        "ply",
+        "format binary_little_endian 1.0",
+        "element vertex %d" % len(coords),
+        "property float x",
+        "property float y",
+        "property float z",
+        "element face %d" % len(triangles),
+        "property list uchar int vertex_indices",
+        "end_header"
+    ]) + "\n"
+
+    faces = np.empty(len(triangles), dtype=PLY_FACE)
+    faces["count"] = 3
+    faces["vertices"] = triangles
+
+    fh.write(header.encode("ascii"))
+    fh.write(np.ascontiguousarray(coords, dtype="<f4").tobytes())
+    fh.write(faces.tobytes())
 
 
 def mesh_triangulate(me):
@@ -621,34 +1649,198 @@ def testImport():
 
 
 # looks at the init json
-def unpackInvocation(opts):
-    modelurl = opts["modelURL"]
-    size = opts["size"]
+def unpackInvocation(opts, sourceType=ModelSource):
+    """ sourceType is the ModelSource flavour doing the geometry work, blender's unless nplib runs
+    the job """
+    if "jobs" in opts:
+        return unpackBatch(opts, sourceType)
+
+    trace = beginTrace()
+    source = loadModelSource(fetchModel(opts["modelURL"], getDownloadCache(opts.get("downloadCache")), opts.get("binaryModels")), sourceType)
+    result = exportJob(source, opts)
+    result["trace"] = trace.asDict()
+    return result
+
+
+def unpackBatch(opts, sourceType=ModelSource):
+    """ several export jobs in one invocation, {"jobs": [job, ...]} plus any options shared by all
+    of them. Jobs on the same modelURL download and parse it once, and each gets its own entry in
+    the results list, in order """
+    shared = dict((key, value) for key, value in opts.items() if key not in ("jobs", "jobID"))
+    jobs = []
+    for job in opts["jobs"]:
+        merged = dict(shared)
+        merged.update(job)
+        jobs.append(merged)
+
+    sources = {}  # modelURL => ModelSource
+    results = []
+    for job in jobs:
+        trace = beginTrace()
+        try:
+            modelurl = job["modelURL"]
+            if modelurl not in sources:
+                sources[modelurl] = loadModelSource(fetchModel(modelurl, getDownloadCache(job.get("downloadCache")), job.get("binaryModels")), sourceType)
+            result = exportJob(sources[modelurl], job)
+        except Exception as e:
+            traceback.print_exc()
+            result = failedResult(e)
+        result["trace"] = trace.asDict()
+        results.append(result)
+
+    completed = all(result["completed"] for result in results)
+    return {"completed": completed, "results": results}
+
+
+def exportJob(source, opts):
+    """ export a single job's options against its already downloaded model. A job may list several
+    sizes instead of one, writing to localPaths (derived from localPath if not given) and returning
+    a result per size. Streamed jobs carry a single file and cannot """
+    if "sizes" in opts and (opts.get("outputFD") is not None or opts.get("outputPipe")):
+        raise Exception("Error: sizes cannot be streamed, a streamed job exports a single file")
+
+    size = opts.get("size")
     visible = opts["visible"]
     localPath = opts["localPath"]
     operators = opts["operators"]
     enableRender = opts["enableRender"]
     importBucket = opts["importBucket"]
+    exportFormat = opts.get("format", "obj")
+    checkExportFormat(exportFormat)
+    stream = openExportStream(opts)
+    cache = getExportCache(opts.get("exportCache"))
+    downloadCache = getDownloadCache(opts.get("downloadCache"))
 
     # convert to hashmap: operatorID => value
     weights = {}
     for w in operators:
         weights[w["id"]] = float(w["value"])
 
-    processExport(modelurl, localPath, size, visible, weights, enableRender, importBucket)
+    if "sizes" in opts:
+        sizes = opts["sizes"]
+        localPaths = opts.get("localPaths") or [sizedPath(localPath, size) for size in sizes]
+        results = exportSizesFromSource(source, localPaths, sizes, visible, weights, enableRender, importBucket, cache, downloadCache, exportFormat, stream)
+        for size, result in zip(sizes, results):
+            result["size"] = size
+        return {"completed": True, "results": results}
+
+    return exportFromSource(source, localPath, size, visible, weights, enableRender, importBucket, cache, downloadCache, exportFormat, stream)
+
+
+def sizedPath(localPath, size):
+    root, extension = os.path.splitext(localPath)
+    return root + "_" + size + extension
+
+
+# blender writes its own chatter to stdout, so result lines are tagged for the caller to pick out
+RESULT_PREFIX = "TROVE_RESULT:"
+
+
+def failedResult(error):
+    """ result hash of a job that raised error; needsBlender tells the caller to retry the job on
+    a blender worker """
+    result = {"completed": False, "error": str(error)}
+    if isinstance(error, NeedsBlender):
+        result["needsBlender"] = True
+    return result
+
+
+def runJob(line, baselineObjects, sourceType=ModelSource):
+    """ run a single newline-delimited job, always producing a result hash """
+    jobID = None
+    try:
+        opts = json.loads(line)
+        jobID = opts.get("jobID")
+        result = unpackInvocation(opts, sourceType)
+    except Exception as e:
+        if not isinstance(e, NeedsBlender):
+            traceback.print_exc()
+        # whatever the failed job got through is still worth reporting
+        result = failedResult(e)
+        result["trace"] = currentTrace.asDict()
+    finally:
+        clearScene(baselineObjects | loadedObjectNames())
+
+    result["jobID"] = jobID
+    return result
+
+
+def runWorker(socketPath=None, sourceType=ModelSource):
+    """ long-lived mode: read one JSON job per line and answer with one JSON result line per job,
+    paying the blender startup and module import cost only once """
+    baselineObjects = set(bpy.data.objects.keys()) if bpy else set()
+
+    if not socketPath:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            writeResult(sys.stdout, runJob(line, baselineObjects, sourceType))
+        return
+
+    # a worker that died without cleaning up leaves its socket file behind, which bind refuses
+    removeIfPresent(socketPath)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socketPath)
+    server.listen(1)
+    try:
+        while True:
+            conn, addr = server.accept()
+            stream = conn.makefile("rw")
+            for line in stream:
+                if not line.strip():
+                    continue
+                writeResult(stream, runJob(line, baselineObjects, sourceType))
+            stream.close()
+            conn.close()
+    finally:
+        server.close()
+        removeIfPresent(socketPath)
+
+
+def writeResult(stream, result):
+    """ one result line, framed the same way on stdout and on a socket """
+    stream.write(RESULT_PREFIX + json.dumps(result) + "\n")
+    stream.flush()
+
+
+def clearScene(baselineObjects):
+    """ drop every object and mesh a job left behind so the next job starts from a clean scene """
+    if bpy:
+        removeObjectsExcept(baselineObjects)
+
+
+def removeObjectsExcept(keepObjects):
+    """ unlink and delete every object not named in keepObjects, then any mesh left without users """
+    scene = bpy.context.scene
+    for ob in list(bpy.data.objects):
+        if ob.name in keepObjects:
+            continue
+        if ob.name in scene.objects:
+            scene.objects.unlink(ob)
+        bpy.data.objects.remove(ob)
+
+    for mesh in list(bpy.data.meshes):
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
 
 
 if __name__ == '__main__':
 
-    import sys
     argv = sys.argv
     if "--" in argv:
         # only want to keep args after "--"
         argv = argv[argv.index("--") + 1:]
 
-    if "--stdin" in argv:
-        argString = sys.stdin.read()
+    if "--worker" in argv:
+        socketPath = None
+        if "--socket" in argv:
+            socketPath = argv[argv.index("--socket") + 1]
+        runWorker(socketPath)
     else:
-        argString = argv[0]
+        if "--stdin" in argv:
+            argString = sys.stdin.read()
+        else:
+            argString = argv[0]
 
-    unpackInvocation(json.loads(argString))
+        result = unpackInvocation(json.loads(argString))
+        sys.stdout.write(RESULT_PREFIX + json.dumps(result) + "\n")
@@ -0,0 +1,104 @@
+"""
+Export engine for the jobs blender adds nothing to, running under a plain python with numpy.
+
+When the visible meshes cannot touch each other there is no boolean to run: the export is the baked
+vertices, concatenated, scaled and written. This module does exactly that from the model arrays,
+reusing blendlib for everything but the geometry, so results, caching and streaming behave the same
+as in blender. Jobs whose meshes might intersect, or that include a subdivision cage, fail with
+needsBlender set for the caller to hand them to blender instead.
+
+    python3 nplib.py '<invocation json>' | --stdin | --worker [--socket path]
+"""
+import json
+import sys
+import numpy as np
+
+import blendlib
+from blendlib import traceSpan, traced
+
+
+class ArraySource(blendlib.ModelSource):
+    """ ModelSource producing the export arrays with numpy instead of blender objects """
+
+    def exportMeshes(self, size, visible, weights, enableRender, importBucket, downloadCache=None):
+        """ same arrays as ModelSource.exportMeshes, a single concatenated mesh. Raises NeedsBlender
+        when the visible meshes would go through a boolean union or need subdividing """
+        tModel = self.model()
+        if not visible:
+            visible = tModel.getDefaultVisible()
+
+        meshes = [tMesh for meshID, tMesh in tModel.meshObjects.items() if meshID in visible]
+        sizeCategory, sizeValue = blendlib.parseSize(size)
+        if sizeCategory == "necklace" and enableRender:
+            meshes.append(blendlib.fetchChainMesh(importBucket, downloadCache))
+
+        if len(meshes) == 0:
+            raise Exception("Error: No visible objects to export. Make sure mesh IDs in the visible list parameter match the json.")
+
+        parts = []
+        for tMesh in meshes:
+            if tMesh.subdivisionLevels:
+                raise blendlib.NeedsBlender("Mesh {0} is a cage to subdivide".format(tMesh.name))
+            with traceSpan("meshBuild"):
+                tMesh.parseArrays()
+            parts.append((tMesh.bakedCoordinates(weights), tMesh.triangleArray))
+
+        checkDisjoint(parts)
+        coords, triangles = concatenateArrays(parts)
+
+        # blender meshes are created flat, extractExportArrays turns on smoothing for renders
+        smooth = np.full(len(triangles), bool(enableRender))
+        loopNormals = None
+        if enableRender and len(triangles):
+            with traceSpan("normals"):
+                loopNormals = blendlib.smoothVertexNormals(coords, triangles)[triangles.ravel()]
+        return [(coords, triangles, smooth, loopNormals)]
+
+
+@traced("union")
+def checkDisjoint(parts):
+    """ the overlap test combineObjects does before deciding between a boolean and concatenation """
+    if len(parts) < 2:
+        return
+
+    bounds = []
+    for coords, triangles in parts:
+        loopStarts = np.arange(0, len(triangles) * 3, 3, dtype=np.int32)
+        bounds.append(blendlib.faceBounds(coords.astype(np.float64), triangles.ravel(), loopStarts))
+
+    for cluster in blendlib.overlapClusters(bounds):
+        if len(cluster) > 1:
+            raise blendlib.NeedsBlender("Meshes {0} may intersect and need a boolean union".format(cluster))
+
+
+def concatenateArrays(parts):
+    """ concatenateObjects for (coords, triangles) pairs """
+    coordBlocks = []
+    triangleBlocks = []
+    vertexOffset = 0
+    for coords, triangles in parts:
+        coordBlocks.append(coords)
+        triangleBlocks.append(triangles + vertexOffset)
+        vertexOffset += len(coords)
+    return np.concatenate(coordBlocks), np.concatenate(triangleBlocks).astype(np.int32)
+
+
+if __name__ == '__main__':
+
+    argv = sys.argv[1:]
+    if "--worker" in argv:
+        socketPath = None
+        if "--socket" in argv:
+            socketPath = argv[argv.index("--socket") + 1]
+        blendlib.runWorker(socketPath, ArraySource)
+    else:
+        if "--stdin" in argv:
+            argString = sys.stdin.read()
+        else:
+            argString = argv[0]
+
+        try:
+            result = blendlib.unpackInvocation(json.loads(argString), ArraySource)
+        except blendlib.NeedsBlender as e:
+            result = blendlib.failedResult(e)
+        sys.stdout.write(blendlib.RESULT_PREFIX + json.dumps(result) + "\n")
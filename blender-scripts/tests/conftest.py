@@ -0,0 +1,36 @@
+"""
+Checks of the numpy paths of blendlib, nplib and trove_export, run under a plain python3 with numpy
+on benchmark/bpy_standin instead of blender.
+
+    python3 -m pytest blender-scripts/tests
+"""
+import os
+import sys
+
+import pytest
+
+scriptsDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(scriptsDir, "benchmark"))
+sys.path.insert(0, scriptsDir)
+
+import bpy_standin
+bpy_standin.install()
+
+modelsDir = os.path.join(scriptsDir, "..", "public", "models")
+
+
+@pytest.fixture(autouse=True)
+def emptyScene():
+    """ every test starts from a scene without objects or meshes """
+    bpy_standin.resetData()
+    yield
+    bpy_standin.resetData()
+
+
+@pytest.fixture
+def modelBytes():
+    """ read a bundled model from public/models by file name """
+    def read(fileName):
+        with open(os.path.join(modelsDir, fileName), "rb") as f:
+            return f.read()
+    return read
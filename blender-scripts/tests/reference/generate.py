@@ -0,0 +1,281 @@
+"""
+Writes the reference exports test_nplib holds nplib to, listed in exports.json, with the exporter
+blendlib had before any of the numpy work: TroveModel.generateExportMesh and exportOBJLite as of
+the repository's first commit, read from git and run unchanged.
+
+They run on a per-element imitation of the blender data they touch: meshes of float32 vertices,
+mathutils vectors in single precision, and blender 2.7x smooth normals (face normals weighted by
+the corner angle, kept as shorts). None of it shares code with blendlib or bpy_standin, so the
+references catch mistakes the numpy exporters would have in common. Models with more than one
+visible mesh need a boolean and cannot be listed.
+
+    python3 blender-scripts/tests/reference/generate.py
+"""
+import json
+import math
+import os
+import subprocess
+import sys
+import types
+
+import numpy as np
+
+BASELINE_COMMIT = "3e865cab4ffb303ee9ba61709a541e07a0b21159"
+
+referenceDir = os.path.dirname(os.path.abspath(__file__))
+scriptsDir = os.path.dirname(os.path.dirname(referenceDir))
+modelsDir = os.path.join(scriptsDir, "..", "public", "models")
+
+
+def component(i):
+    return property(lambda self: float(self.values[i]), lambda self, value: self.values.__setitem__(i, value))
+
+
+class Vector():
+    """ mathutils.Vector of three single precision floats, a view into mesh data where blender's is """
+    def __init__(self, values):
+        if isinstance(values, np.ndarray) and values.dtype == np.float32:
+            self.values = values
+        else:
+            self.values = np.array(values, dtype=np.float32)
+
+    x, y, z = component(0), component(1), component(2)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return tuple(float(value) for value in self.values[key])
+        return float(self.values[key])
+
+    def __len__(self):
+        return 3
+
+    def __mul__(self, scalar):
+        return Vector(self.values * np.float32(scalar))
+
+
+class Matrix():
+    """ mathutils.Matrix, where * is the matrix product as in blender 2.7x """
+    def __init__(self, rows=None):
+        self.rows = np.identity(4) if rows is None else np.asarray(rows, dtype=np.float64)
+
+    def __mul__(self, other):
+        return Matrix(self.rows.dot(other.rows))
+
+
+class Vertex():
+    def __init__(self, mesh, index):
+        self.mesh = mesh
+        self.index = index
+
+    @property
+    def co(self):
+        return Vector(self.mesh.coords[self.index])
+
+    @co.setter
+    def co(self, value):
+        self.mesh.coords[self.index] = value.values if isinstance(value, Vector) else value
+
+    @property
+    def normal(self):
+        return Vector(self.mesh.vertexNormals[self.index])
+
+
+class Polygon():
+    def __init__(self, mesh, index):
+        self.mesh = mesh
+        self.index = index
+        self.material_index = 0
+
+    @property
+    def vertices(self):
+        return tuple(int(v) for v in self.mesh.triangles[self.index])
+
+    @property
+    def loop_indices(self):
+        return range(3 * self.index, 3 * self.index + 3)
+
+    @property
+    def use_smooth(self):
+        return bool(self.mesh.smooth[self.index])
+
+    @use_smooth.setter
+    def use_smooth(self, value):
+        self.mesh.smooth[self.index] = value
+
+
+class Loop():
+    def __init__(self, mesh, index):
+        self.mesh = mesh
+        self.index = index
+
+    @property
+    def vertex_index(self):
+        return int(self.mesh.triangles.ravel()[self.index])
+
+    @property
+    def normal(self):
+        return Vector(self.mesh.loopNormals[self.index])
+
+
+class Elements():
+    """ mesh.vertices, mesh.polygons or mesh.loops, made of element objects on demand """
+    def __init__(self, mesh, elementType, count):
+        self.mesh = mesh
+        self.elementType = elementType
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.elementType(self.mesh, i) for i in range(self.count)[key]]
+        return self.elementType(self.mesh, key)
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+class Mesh():
+    def __init__(self, name):
+        self.name = name
+        self.materials = []
+        self.from_pydata([], [], [])
+
+    def from_pydata(self, vertices, edges, faces):
+        self.coords = np.array(vertices, dtype=np.float32).reshape(-1, 3)
+        self.triangles = np.array(faces, dtype=np.int64).reshape(-1, 3)
+        self.smooth = np.zeros(len(self.triangles), dtype=bool)
+        self.vertexNormals = np.zeros_like(self.coords)
+        self.loopNormals = np.zeros((3 * len(self.triangles), 3), dtype=np.float32)
+
+    vertices = property(lambda self: Elements(self, Vertex, len(self.coords)))
+    polygons = property(lambda self: Elements(self, Polygon, len(self.triangles)))
+    loops = property(lambda self: Elements(self, Loop, 3 * len(self.triangles)))
+
+    def update(self, calc_edges=False, calc_tessface=False):
+        pass
+
+    def transform(self, matrix):
+        rows = matrix.rows
+        self.coords = (self.coords.astype(np.float64).dot(rows[:3, :3].T) + rows[:3, 3]).astype(np.float32)
+
+    def calc_normals(self):
+        """ blender 2.7x vertex normals: every corner adds its face's unit normal weighted by the
+        angle between the corner's edges, the sum is normalized (a vertex without faces takes its
+        own direction instead) and stored as shorts truncated towards zero; all single precision """
+        accumulated = np.zeros((len(self.coords), 3), dtype=np.float32)
+        for triangle in self.triangles:
+            corners = self.coords[triangle]
+            faceNormal = np.cross(corners[0] - corners[1], corners[1] - corners[2])
+            faceNormal /= np.float32(math.sqrt(np.dot(faceNormal, faceNormal))) or np.float32(1)
+            for i in range(3):
+                arriving = corners[i] - corners[i - 1]
+                leaving = corners[(i + 1) % 3] - corners[i]
+                arriving /= np.float32(math.sqrt(np.dot(arriving, arriving))) or np.float32(1)
+                leaving /= np.float32(math.sqrt(np.dot(leaving, leaving))) or np.float32(1)
+                cosine = -float(np.dot(arriving, leaving))
+                angle = np.float32(math.acos(max(-1.0, min(1.0, cosine))))
+                accumulated[triangle[i]] += faceNormal * angle
+
+        shorts = np.zeros((len(self.coords), 3), dtype=np.int16)
+        for v, normal in enumerate(accumulated):
+            length = math.sqrt(np.dot(normal, normal))
+            if length == 0:
+                normal = self.coords[v]
+                length = math.sqrt(np.dot(normal, normal)) or 1.0
+            shorts[v] = np.trunc(normal / np.float32(length) * np.float32(32767))
+        self.vertexNormals = shorts.astype(np.float32) * np.float32(1.0 / 32767)
+
+    def calc_normals_split(self):
+        """ split normals of smooth faces without sharp edges, all exportOBJLite produces: the
+        vertex normals of each corner """
+        self.calc_normals()
+        self.loopNormals = self.vertexNormals[self.triangles.ravel()]
+
+    def copy(self):
+        duplicate = Mesh(self.name)
+        duplicate.coords = self.coords.copy()
+        duplicate.triangles = self.triangles.copy()
+        duplicate.smooth = self.smooth.copy()
+        duplicate.vertexNormals = self.vertexNormals.copy()
+        return duplicate
+
+
+class Object():
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.parent = None
+        self.dupli_type = 'NONE'
+        self.location = (0, 0, 0)
+
+    @property
+    def location(self):
+        return self._location
+
+    @location.setter
+    def location(self, value):
+        self._location = Vector(value)
+
+    @property
+    def matrix_world(self):
+        rows = np.identity(4)
+        rows[:3, 3] = self.location.values
+        return Matrix(rows)
+
+    def to_mesh(self, scene, apply_modifiers, settings):
+        return self.data.copy()
+
+
+def transformApply(context, location=False, rotation=False, scale=False):
+    """ bpy.ops.object.transform_apply with location only: the object's offset moves into its vertices """
+    ob = context["active_object"]
+    ob.data.coords += ob.location.values
+    ob.location = (0, 0, 0)
+
+
+def blenderModules():
+    scene = types.SimpleNamespace(objects=types.SimpleNamespace(link=lambda ob: None))
+    bpy = types.ModuleType("bpy")
+    bpy.data = types.SimpleNamespace(
+        meshes=types.SimpleNamespace(new=Mesh, remove=lambda mesh: None),
+        objects=types.SimpleNamespace(new=Object))
+    bpy.context = types.SimpleNamespace(scene=scene, copy=dict)
+    bpy.ops = types.SimpleNamespace(object=types.SimpleNamespace(transform_apply=transformApply))
+
+    # every mesh of a model is already triangulated
+    bmesh = types.ModuleType("bmesh")
+    bmesh.new = lambda: types.SimpleNamespace(from_mesh=lambda mesh: None, to_mesh=lambda mesh: None, free=lambda: None, faces=())
+    bmesh.ops = types.SimpleNamespace(triangulate=lambda bm, faces: None)
+
+    mathutils = types.ModuleType("mathutils")
+    mathutils.Vector = Vector
+    mathutils.Matrix = Matrix
+    return {"bpy": bpy, "bmesh": bmesh, "mathutils": mathutils}
+
+
+def loadBaseline():
+    """ blendlib.py of BASELINE_COMMIT as a module, importing the imitation blender """
+    source = subprocess.check_output(["git", "show", BASELINE_COMMIT + ":blender-scripts/blendlib.py"], cwd=scriptsDir)
+    sys.modules.update(blenderModules())
+    baseline = types.ModuleType("baseline_blendlib")
+    exec(compile(source, "blendlib.py@" + BASELINE_COMMIT[:7], "exec"), baseline.__dict__)
+    return baseline
+
+
+def main():
+    baseline = loadBaseline()
+    with open(os.path.join(referenceDir, "exports.json"), "r") as f:
+        exports = json.load(f)
+
+    for export in exports:
+        with open(os.path.join(modelsDir, export["model"]), "r") as f:
+            model = baseline.TroveModel(json.load(f))
+        exportMesh = model.generateExportMesh(export["size"], export["visible"], export["weights"], export["enableRender"], "bucket")
+        baseline.exportOBJLite([exportMesh], os.path.join(referenceDir, export["reference"]), export["enableRender"])
+        print("wrote", export["reference"])
+
+
+if __name__ == "__main__":
+    main()
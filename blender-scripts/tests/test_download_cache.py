@@ -0,0 +1,108 @@
+import hashlib
+import http.server
+import os
+import threading
+import urllib.error
+
+import pytest
+
+import blendlib
+
+
+class ModelHandler(http.server.BaseHTTPRequestHandler):
+    """ serves server.objects (path => bytes) with MD5 ETags, answering If-None-Match with a 304
+    and unknown paths with a 404 the way cloud storage does, and logs each request """
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        body = self.server.objects.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def modelServer():
+    server = http.server.HTTPServer(("127.0.0.1", 0), ModelHandler)
+    server.objects = {}
+    server.requests = []
+    server.url = "http://127.0.0.1:%d" % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def testRevalidatesWithETag(tmp_path, modelServer):
+    cache = blendlib.DownloadCache(str(tmp_path))
+    url = modelServer.url + "/model.json"
+    modelServer.objects["/model.json"] = b'{"version": 1}'
+
+    assert cache.fetch(url) == b'{"version": 1}'
+    assert cache.fetch(url) == b'{"version": 1}'
+    etag = '"%s"' % hashlib.md5(b'{"version": 1}').hexdigest()
+    assert modelServer.requests == [("/model.json", None), ("/model.json", etag)]
+
+    modelServer.objects["/model.json"] = b'{"version": 2}'
+    assert cache.fetch(url) == b'{"version": 2}'
+
+
+def testFreshEntriesSkipTheServer(tmp_path, modelServer):
+    cache = blendlib.DownloadCache(str(tmp_path), maxAge=60)
+    url = modelServer.url + "/model.json"
+    modelServer.objects["/model.json"] = b'{"version": 1}'
+
+    cache.fetch(url)
+    modelServer.objects["/model.json"] = b'{"version": 2}'
+    assert cache.fetch(url) == b'{"version": 1}'
+    assert len(modelServer.requests) == 1
+
+
+def testRemembersMissingObjects(tmp_path, modelServer):
+    cache = blendlib.DownloadCache(str(tmp_path), maxAge=60)
+    url = modelServer.url + "/model.bin"
+
+    for attempt in range(2):
+        with pytest.raises(urllib.error.HTTPError) as raised:
+            cache.fetch(url)
+        assert raised.value.code == 404
+    assert len(modelServer.requests) == 1
+
+    # once maxAge has passed the object is asked for again
+    modelServer.objects["/model.bin"] = b"TROVEBIN"
+    cache.maxAge = 0
+    assert cache.fetch(url) == b"TROVEBIN"
+    assert len(modelServer.requests) == 2
+
+
+def testUnreadableMetaIsAMiss(tmp_path, modelServer):
+    cache = blendlib.DownloadCache(str(tmp_path))
+    url = modelServer.url + "/model.json"
+    modelServer.objects["/model.json"] = b'{"version": 1}'
+    cache.fetch(url)
+
+    # a meta file cut short, say by a full disk, is fetched again without revalidation
+    metaPath = cache.entryPaths(url)[1]
+    with open(metaPath, "w") as f:
+        f.write('{"url": ')
+    assert cache.fetch(url) == b'{"version": 1}'
+    assert modelServer.requests[-1] == ("/model.json", None)
+    assert cache.readMeta(metaPath)["url"] == url
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(".partial")]
@@ -0,0 +1,112 @@
+import io
+import os
+
+import pytest
+
+import blendlib
+import nplib
+
+
+def testKeysNormalizeEquivalentRequests(tmp_path):
+    cache = blendlib.ExportCache(str(tmp_path), weightPrecision=0.001)
+    key = cache.makeKey("digest", "ring_7", ["a", "b"], {"op1": 0.5, "op2": 0.25}, True)
+
+    # visible order, weight order and weights within weightPrecision don't matter
+    assert cache.makeKey("digest", "ring_7", ["b", "a"], {"op2": 0.25, "op1": 0.5}, True) == key
+    assert cache.makeKey("digest", "ring_7", ["a", "b"], {"op1": 0.5002, "op2": 0.2499}, 1) == key
+    assert cache.makeKey("digest", "ring_7", None, {}, False) == cache.makeKey("digest", "ring_7", [], {}, False)
+
+
+@pytest.mark.parametrize("change", [
+    {"modelDigest": "other"},
+    {"size": "ring_8"},
+    {"visible": ["a"]},
+    {"weights": {"op1": 0.502, "op2": 0.25}},
+    {"enableRender": False},
+    {"exportFormat": "stl"},
+])
+def testKeysTellDifferentRequestsApart(tmp_path, change):
+    cache = blendlib.ExportCache(str(tmp_path), weightPrecision=0.001)
+    request = {
+        "modelDigest": "digest",
+        "size": "ring_7",
+        "visible": ["a", "b"],
+        "weights": {"op1": 0.5, "op2": 0.25},
+        "enableRender": True,
+        "exportFormat": "obj"
+    }
+    changed = dict(request, **change)
+    assert cache.makeKey(**request) != cache.makeKey(**changed)
+
+
+def testDefaultVisibleSharesEntries(tmp_path, modelBytes):
+    cache = blendlib.ExportCache(str(tmp_path / "cache"))
+    source = nplib.ArraySource(modelBytes("bar_ring.json"), "bar_ring")
+    exportPath = str(tmp_path / "out.obj")
+
+    first = blendlib.exportFromSource(source, exportPath, "ring_7", None, {}, False, "bucket", cache)
+    explicit = blendlib.exportFromSource(source, exportPath, "ring_7", source.model().getDefaultVisible(), {}, False, "bucket", cache)
+    empty = blendlib.exportFromSource(source, exportPath, "ring_7", [], {}, False, "bucket", cache)
+    assert (first["cache"], explicit["cache"], empty["cache"]) == ("miss", "hit", "hit")
+
+
+def testAbortedExportLeavesNoPartialEntry(tmp_path, modelBytes, monkeypatch):
+    cacheDir = tmp_path / "cache"
+    cache = blendlib.ExportCache(str(cacheDir))
+    source = nplib.ArraySource(modelBytes("bar_ring.json"), "bar_ring")
+
+    def failingWrite(out, exportMeshes, exportFormat="obj"):
+        out.write(b"v 0 0 0\n")
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(blendlib, "writeExport", failingWrite)
+
+    with pytest.raises(RuntimeError):
+        blendlib.exportFromSource(source, str(tmp_path / "out.obj"), "ring_7", None, {}, False, "bucket", cache)
+    assert os.listdir(str(cacheDir)) == []
+
+
+def testConcurrentWritersOfOneKey(tmp_path):
+    cache = blendlib.ExportCache(str(tmp_path))
+    key = cache.makeKey("digest", "ring_7", None, {}, False)
+
+    # two workers exporting the same request at once each write a partial of their own
+    first = cache.openEntry(key)
+    second = cache.openEntry(key)
+    first.write(b"first")
+    second.write(b"second")
+    first.close()
+    second.close()
+    cache.commitEntry(key, second, {"byteSize": 6})
+    cache.commitEntry(key, first, {"byteSize": 5})
+
+    stats, entryFile = cache.lookup(key)
+    assert stats == {"byteSize": 5}
+    assert entryFile.read() == b"first"
+    entryFile.close()
+    assert sorted(os.listdir(str(tmp_path))) == [key, key + ".meta"]
+
+
+def testEvictedEntriesAreMisses(tmp_path):
+    cache = blendlib.ExportCache(str(tmp_path))
+    key = cache.makeKey("digest", "ring_7", None, {}, False)
+    entryFile = cache.openEntry(key)
+    entryFile.write(b"v 0 0 0\n")
+    entryFile.close()
+    cache.commitEntry(key, entryFile, {"byteSize": 8})
+
+    # evicted by another worker between lookup and copy, the open entry is still read whole
+    stats, entryFile = cache.lookup(key)
+    blendlib.evictLeastRecent(str(tmp_path), 0)
+    copy = io.BytesIO()
+    cache.copyTo(key, entryFile, copy)
+    assert copy.getvalue() == b"v 0 0 0\n"
+    assert cache.lookup(key) is None
+
+
+def testEvictionSkipsVanishedFiles(tmp_path, monkeypatch):
+    (tmp_path / "kept").write_bytes(b"0123456789")
+    listdir = os.listdir
+    # a file another worker removed after it was listed
+    monkeypatch.setattr(os, "listdir", lambda path: listdir(path) + ["vanished", "vanished.meta"])
+    blendlib.evictLeastRecent(str(tmp_path), 0)
+    assert listdir(str(tmp_path)) == []
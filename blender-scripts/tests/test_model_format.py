@@ -0,0 +1,57 @@
+import base64
+
+import numpy as np
+
+import blendlib
+import trove_export
+
+
+def testVarintsRoundTrip():
+    rng = np.random.default_rng(23)
+    values = np.concatenate([
+        [0, 1, -1, 63, -64, 64, -65, 8191, 8192, -8193],
+        [2 ** 62, -2 ** 62, 2 ** 63 - 1, -2 ** 63],
+        rng.integers(-2 ** 40, 2 ** 40, 1000),
+        rng.integers(-100, 100, 1000),
+    ]).astype(np.int64)
+    np.testing.assert_array_equal(blendlib.unpackIntegers(trove_export.pack_integers(values)), values)
+
+
+def testVarintLengths():
+    # one byte carries 7 bits of the zigzagged value: 0, -1, 1, -2 ... 63, -64 fit in one byte
+    assert len(base64.b64decode(trove_export.pack_integers([63, -64]))) == 2
+    assert len(base64.b64decode(trove_export.pack_integers([64, -65]))) == 4
+    assert trove_export.pack_integers([]) == ""
+    assert len(blendlib.unpackIntegers("")) == 0
+
+
+def testDeltaCodedIndicesRoundTrip():
+    rng = np.random.default_rng(5)
+    triangles = rng.integers(0, 100000, (2000, 3)).astype(np.int32)
+    packed = trove_export.pack_integers(trove_export.delta_code(triangles))
+    np.testing.assert_array_equal(blendlib.decodeDeltas(packed), triangles.ravel())
+
+    sortedIndices = np.sort(rng.choice(100000, 500, replace=False))
+    packed = trove_export.pack_integers(trove_export.delta_code(sortedIndices))
+    np.testing.assert_array_equal(blendlib.decodeDeltas(packed), sortedIndices)
+
+
+def testFixedPointWithinPrecision():
+    rng = np.random.default_rng(7)
+    precision = 0.0001
+    coords = (rng.random((5000, 3)) * 40 - 20).astype(np.float32)
+
+    # the way write_mesh quantizes vertices, offset by their lower corner
+    offset = coords.min(axis=0).astype(np.float64)
+    quantized, readVertices = trove_export.quantize(coords, 2 * precision, offset)
+    decoded = blendlib.decodeFixedPoint(trove_export.pack_integers(quantized), 2 * precision, offset.tolist())
+
+    # the reader gets exactly what the exporter put in the binary companion
+    np.testing.assert_array_equal(decoded, readVertices.ravel())
+    assert np.abs(decoded.astype(np.float64) - coords.ravel()).max() <= precision + 1e-6
+
+    displacements = rng.normal(0, 0.05, 3000).astype(np.float32)
+    quantized, components = trove_export.quantize(displacements, 2 * precision)
+    decoded = blendlib.decodeFixedPoint(trove_export.pack_integers(quantized), 2 * precision)
+    np.testing.assert_array_equal(decoded, components)
+    assert np.abs(decoded.astype(np.float64) - displacements).max() <= precision
@@ -0,0 +1,91 @@
+import io
+import math
+
+import numpy as np
+
+import blendlib
+
+
+def angleWeightedNormals(coords, triangles):
+    """ blender's smooth vertex normals written out corner by corner: unit face normals weighted
+    by the angle at the corner, normalized, the position standing in for vertices without faces """
+    normals = np.zeros((len(coords), 3))
+    for triangle in triangles:
+        corners = coords[triangle].astype(np.float64)
+        faceNormal = np.cross(corners[1] - corners[0], corners[2] - corners[0])
+        faceNormal /= np.linalg.norm(faceNormal)
+        for i in range(3):
+            leaving = corners[(i + 1) % 3] - corners[i]
+            arriving = corners[(i + 2) % 3] - corners[i]
+            cosine = np.dot(leaving, arriving) / (np.linalg.norm(leaving) * np.linalg.norm(arriving))
+            normals[triangle[i]] += faceNormal * math.acos(max(-1.0, min(1.0, cosine)))
+
+    for v in range(len(coords)):
+        if not normals[v].any():
+            normals[v] = coords[v]
+        length = np.linalg.norm(normals[v])
+        if length:
+            normals[v] /= length
+    return normals
+
+
+def testSmoothNormalsMatchCornerByCorner():
+    rng = np.random.default_rng(20)
+    coords = rng.normal(0, 1, (60, 3)).astype(np.float32)
+    triangles = np.array([rng.choice(50, 3, replace=False) for i in range(120)], dtype=np.int32)
+
+    normals = blendlib.smoothVertexNormals(coords, triangles)
+    assert normals.dtype == np.float32
+    # stored as shorts, truncated towards zero; the last ten vertices have no faces
+    np.testing.assert_allclose(normals, angleWeightedNormals(coords, triangles), rtol=0, atol=1.0 / 32767 + 1e-7)
+    shorts = normals.astype(np.float64) * 32767
+    np.testing.assert_allclose(shorts, np.round(shorts), rtol=0, atol=1e-3)
+
+
+def testSmoothNormalsOfACube():
+    corners = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=np.float32)
+    triangles = np.array([
+        [0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5],
+        [0, 4, 5], [0, 5, 1], [2, 3, 7], [2, 7, 6],
+        [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3],
+    ], dtype=np.int32)
+    normals = blendlib.smoothVertexNormals(corners, triangles)
+
+    # every corner sees its three faces at right angles, the normal points out along the diagonal
+    diagonal = math.trunc(32767 / math.sqrt(3)) / 32767.0
+    np.testing.assert_allclose(np.abs(normals), diagonal, rtol=0, atol=1e-7)
+    assert np.all(np.sign(normals) == np.sign(corners))
+
+
+def veckeyDedupe(loopNormals):
+    """ the distinct normals numbered in order of first appearance, keyed on round(x, 4) per component """
+    numbers = {}
+    unique = []
+    perLoop = []
+    for normal in loopNormals:
+        key = tuple(round(float(c), 4) for c in normal)
+        if key not in numbers:
+            numbers[key] = len(unique)
+            unique.append(key)
+        perLoop.append(numbers[key])
+    return unique, perLoop
+
+
+def testDedupeNormalsMatchesRounding():
+    rng = np.random.default_rng(4)
+    randomNormals = rng.normal(0, 1, (3000, 3))
+    # values on the rounding boundary, near-zeros of both signs, and plenty of repeats
+    ties = (rng.integers(-10000, 10000, (3000, 3)) + 0.5) / 10000
+    zeros = rng.choice([0.0, -0.0, 0.00004, -0.00004, 0.00005, -0.00005], (300, 3))
+    loopNormals = np.concatenate([randomNormals, ties, zeros, randomNormals[::7]]).astype(np.float32)
+    rng.shuffle(loopNormals)
+
+    unique, normalIndex = blendlib.dedupeNormals(loopNormals)
+    expectedUnique, expectedIndex = veckeyDedupe(loopNormals)
+    np.testing.assert_array_equal(normalIndex, expectedIndex)
+
+    # compared as written to the obj, which tells signed zeros apart
+    written = io.BytesIO()
+    blendlib.writeRows(written, "vn %.6f %.6f %.6f\n", unique)
+    expected = "".join("vn %.6f %.6f %.6f\n" % key for key in expectedUnique)
+    assert written.getvalue().decode("ascii") == expected
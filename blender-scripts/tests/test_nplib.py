@@ -0,0 +1,124 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import blendlib
+import nplib
+
+referenceDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference")
+with open(os.path.join(referenceDir, "exports.json"), "r") as f:
+    REFERENCE_EXPORTS = json.load(f)
+
+# %.6f rounding plus the odd float32 ulp between single precision mathutils and numpy's float64
+COORDINATE_TOLERANCE = 1e-5
+# a short of a stored normal plus the 4 places the obj keeps of it
+NORMAL_TOLERANCE = 1.0 / 32767 + 1e-4
+
+
+def export(job, tmp_path, modelBytes, exportFormat):
+    source = nplib.ArraySource(modelBytes(job["model"]), job["model"])
+    exportPath = str(tmp_path / ("export." + exportFormat))
+    result = blendlib.exportFromSource(source, exportPath, job["size"], job["visible"], job["weights"], job["enableRender"], "bucket", exportFormat=exportFormat)
+    assert result["completed"]
+    with open(exportPath, "rb") as f:
+        return f.read()
+
+
+def readOBJ(data):
+    """ vertices, normals, faces as (vertex index, normal index or None) corners counting from 0,
+    and the smoothing of each face from the "s" line above it """
+    vertices, normals, faces, smooth = [], [], [], []
+    smoothing = None
+    for line in data.decode("ascii").splitlines():
+        fields = line.split()
+        if fields[0] == "v":
+            vertices.append([float(c) for c in fields[1:]])
+        elif fields[0] == "vn":
+            normals.append([float(c) for c in fields[1:]])
+        elif fields[0] == "s":
+            smoothing = fields[1]
+        elif fields[0] == "f":
+            corners = [corner.split("//") for corner in fields[1:]]
+            faces.append([(int(c[0]) - 1, int(c[1]) - 1 if len(c) > 1 else None) for c in corners])
+            smooth.append(smoothing)
+    return np.array(vertices).reshape(-1, 3), np.array(normals).reshape(-1, 3), faces, smooth
+
+
+def referenceOBJ(job):
+    with open(os.path.join(referenceDir, job["reference"]), "rb") as f:
+        return readOBJ(f.read())
+
+
+def referenceTriangles(job):
+    vertices, normals, faces, smooth = referenceOBJ(job)
+    return vertices, np.array([[v for v, n in face] for face in faces])
+
+
+@pytest.mark.parametrize("job", REFERENCE_EXPORTS, ids=lambda job: job["reference"])
+def testOBJMatchesBaselineExporter(tmp_path, modelBytes, job):
+    vertices, normals, faces, smooth = readOBJ(export(job, tmp_path, modelBytes, "obj"))
+    expectedVertices, expectedNormals, expectedFaces, expectedSmooth = referenceOBJ(job)
+
+    np.testing.assert_allclose(vertices, expectedVertices, rtol=0, atol=COORDINATE_TOLERANCE)
+    assert [[v for v, n in face] for face in faces] == [[v for v, n in face] for face in expectedFaces]
+    assert smooth == expectedSmooth
+
+    # compared corner by corner, normals within tolerance of each other may dedupe differently
+    if job["enableRender"]:
+        cornerNormals = normals[[n for face in faces for v, n in face]]
+        expectedCornerNormals = expectedNormals[[n for face in expectedFaces for v, n in face]]
+        np.testing.assert_allclose(cornerNormals, expectedCornerNormals, rtol=0, atol=NORMAL_TOLERANCE)
+    else:
+        assert len(normals) == 0
+
+
+@pytest.mark.parametrize("job", REFERENCE_EXPORTS, ids=lambda job: job["reference"])
+def testSTLHoldsTheReferenceTriangles(tmp_path, modelBytes, job):
+    data = export(job, tmp_path, modelBytes, "stl")
+    count = int(np.frombuffer(data, dtype="<u4", count=1, offset=80)[0])
+    records = np.frombuffer(data, dtype=blendlib.STL_TRIANGLE, count=count, offset=84)
+    assert len(data) == 84 + records.nbytes
+
+    vertices, triangles = referenceTriangles(job)
+    corners = vertices[triangles]
+    np.testing.assert_allclose(records["vertices"], corners, rtol=0, atol=COORDINATE_TOLERANCE)
+
+    # facet normals point out of the counter-clockwise side
+    facing = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    assert np.all(np.einsum("ij,ij->i", records["normal"], facing) > 0)
+
+
+@pytest.mark.parametrize("job", REFERENCE_EXPORTS, ids=lambda job: job["reference"])
+def testPLYHoldsTheReferenceMesh(tmp_path, modelBytes, job):
+    data = export(job, tmp_path, modelBytes, "ply")
+    headerEnd = data.index(b"end_header\n") + len(b"end_header\n")
+    header = data[:headerEnd].decode("ascii").splitlines()
+    numVertices = int(header[2].split()[-1])
+    numFaces = int(header[6].split()[-1])
+
+    coords = np.frombuffer(data, dtype="<f4", count=numVertices * 3, offset=headerEnd).reshape(-1, 3)
+    faces = np.frombuffer(data, dtype=blendlib.PLY_FACE, count=numFaces, offset=headerEnd + coords.nbytes)
+    assert len(data) == headerEnd + coords.nbytes + faces.nbytes
+
+    vertices, triangles = referenceTriangles(job)
+    np.testing.assert_allclose(coords, vertices, rtol=0, atol=COORDINATE_TOLERANCE)
+    assert np.all(faces["count"] == 3)
+    np.testing.assert_array_equal(faces["vertices"], triangles)
+
+
+def testIntersectingMeshesNeedBlender(tmp_path, modelBytes):
+    source = nplib.ArraySource(modelBytes("cut_out_ring.json"), "cut_out_ring")
+    with pytest.raises(blendlib.NeedsBlender):
+        blendlib.exportFromSource(source, str(tmp_path / "out.obj"), "ring_7", None, {}, False, "bucket")
+
+    result = blendlib.failedResult(blendlib.NeedsBlender("union"))
+    assert result["needsBlender"] and not result["completed"]
+
+
+def testUnknownFormatOpensNoOutput(tmp_path, modelBytes):
+    source = nplib.ArraySource(modelBytes("bar_ring.json"), "bar_ring")
+    with pytest.raises(Exception, match="unknown export format"):
+        blendlib.exportFromSource(source, str(tmp_path / "out.obj"), "ring_7", None, {}, False, "bucket", exportFormat="../obj")
+    assert list(tmp_path.iterdir()) == []
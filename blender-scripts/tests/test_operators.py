@@ -0,0 +1,94 @@
+import numpy as np
+
+import blendlib
+
+
+def randomOperators(rng, numVertices, numOperators, mesh="main.Band"):
+    """ TroveOperators displacing random, overlapping subsets of the vertices, some with a weight
+    range not starting at 0 """
+    operators = []
+    for k in range(numOperators):
+        count = int(rng.integers(1, numVertices))
+        indices = np.sort(rng.choice(numVertices, count, replace=False))
+        operators.append(blendlib.TroveOperator({
+            "id": "op%d" % k,
+            "type": "shape",
+            "mesh": mesh,
+            "minWeight": float(rng.choice([0, -0.5, 0.25])),
+            "maxWeight": float(rng.choice([1, 2])),
+            "parameters": {
+                "modifiedCount": count,
+                "indices": indices.tolist(),
+                "displacements": rng.normal(0, 0.1, count * 3).astype(np.float32).tolist()
+            }
+        }))
+    return operators
+
+
+def scatterAddBake(vertexArray, operators, weights):
+    """ the bake OperatorMatrix replaced: each operator's weight remapped onto [minWeight, maxWeight]
+    and its displacements added one operator at a time """
+    coords = vertexArray.astype(np.float64).reshape(-1, 3).copy()
+    for op in operators:
+        value = op.minWeight + (op.maxWeight - op.minWeight) * weights.get(op.name, 0)
+        np.add.at(coords, op.indices, np.multiply(op.displacements, value, dtype=np.float64))
+    return coords
+
+
+def testBakeMatchesScatterAdd():
+    rng = np.random.default_rng(18)
+    vertexArray = rng.normal(0, 1, 300 * 3).astype(np.float32)
+    operators = randomOperators(rng, 300, 6)
+
+    for weights in ({}, {"op0": 1.0}, {"op1": 0.3, "op4": 0.9, "op5": 0.0}, dict(("op%d" % k, rng.random()) for k in range(6))):
+        # a fresh matrix every time, so each bake is a full one
+        baked = blendlib.OperatorMatrix(vertexArray, operators).bake(weights)
+        expected = scatterAddBake(vertexArray, operators, weights)
+        # summed in another order, but the float32 positions written to the mesh are the same
+        np.testing.assert_allclose(baked, expected, rtol=0, atol=1e-14)
+        np.testing.assert_array_equal(baked.astype(np.float32), expected.astype(np.float32))
+
+
+def testBakeIgnoresUnknownOperators():
+    rng = np.random.default_rng(7)
+    vertexArray = rng.normal(0, 1, 30 * 3).astype(np.float32)
+    operators = randomOperators(rng, 30, 2)
+    matrix = blendlib.OperatorMatrix(vertexArray, operators)
+    np.testing.assert_array_equal(matrix.bake({"elsewhere": 1.0}), blendlib.OperatorMatrix(vertexArray, operators).bake({}))
+
+
+def testIncrementalBakesTrackFullBakes():
+    rng = np.random.default_rng(19)
+    vertexArray = rng.normal(0, 1, 500 * 3).astype(np.float32)
+    operators = randomOperators(rng, 500, 8)
+    matrix = blendlib.OperatorMatrix(vertexArray, operators)
+
+    # single slider moves, as a customizer sends them, past a couple of full rebakes
+    weights = {}
+    sawFullRebake = False
+    for step in range(3 * blendlib.OperatorMatrix.FULL_BAKE_INTERVAL + 5):
+        weights["op%d" % rng.integers(8)] = rng.random()
+        baked = matrix.bake(weights).copy()
+        sawFullRebake |= step > 0 and matrix.incrementalBakes == 0
+        fullBake = blendlib.OperatorMatrix(vertexArray, operators).bake(weights)
+        np.testing.assert_allclose(baked, fullBake, rtol=0, atol=1e-13)
+    assert sawFullRebake
+
+
+def testIncrementalBakeAfterReset():
+    rng = np.random.default_rng(3)
+    vertexArray = rng.normal(0, 1, 50 * 3).astype(np.float32)
+    operators = randomOperators(rng, 50, 3)
+    matrix = blendlib.OperatorMatrix(vertexArray, operators)
+
+    matrix.bake({"op0": 1.0, "op1": 0.5, "op2": 0.25})
+    # back to no weights at all has to undo every operator, not just skip them
+    np.testing.assert_allclose(matrix.bake({}), blendlib.OperatorMatrix(vertexArray, operators).bake({}), rtol=0, atol=1e-14)
+
+
+def testLoadedModelsAreReused(modelBytes):
+    data = modelBytes("bar_ring.json")
+    source = blendlib.loadModelSource(data)
+    tModel = source.model()
+    assert blendlib.loadModelSource(bytes(data)) is source
+    assert source.model() is tModel
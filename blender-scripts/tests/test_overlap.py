@@ -0,0 +1,69 @@
+import numpy as np
+
+import blendlib
+
+CUBE_CORNERS = np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=np.float64)
+CUBE_TRIANGLES = np.array([
+    [0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5],  # x = 0, x = 1
+    [0, 4, 5], [0, 5, 1], [2, 3, 7], [2, 7, 6],  # y = 0, y = 1
+    [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3],  # z = 0, z = 1
+])
+
+
+def boxes(*extents):
+    """ (coords, triangles) of one mesh made of an axis aligned box per (min corner, max corner) """
+    coordBlocks = []
+    triangleBlocks = []
+    for boxMin, boxMax in extents:
+        triangleBlocks.append(CUBE_TRIANGLES + 8 * len(coordBlocks))
+        coordBlocks.append(np.asarray(boxMin) + CUBE_CORNERS * (np.asarray(boxMax) - np.asarray(boxMin)))
+    return np.concatenate(coordBlocks), np.concatenate(triangleBlocks)
+
+
+def clusters(*meshes):
+    bounds = []
+    for coords, triangles in meshes:
+        loopStarts = np.arange(0, len(triangles) * 3, 3)
+        bounds.append(blendlib.faceBounds(coords, triangles.ravel(), loopStarts))
+    return blendlib.overlapClusters(bounds)
+
+
+def testDisjointBoxesStayApart():
+    assert clusters(boxes(([0, 0, 0], [1, 1, 1])), boxes(([2, 0, 0], [3, 1, 1]))) == [[0], [1]]
+
+
+def testTouchingBoxesAreClustered():
+    assert clusters(boxes(([0, 0, 0], [1, 1, 1])), boxes(([1, 0, 0], [2, 1, 1]))) == [[0, 1]]
+
+
+def testNestedBoxesAreClustered():
+    # the surfaces never meet, but only a boolean can tell whether the inner part is enclosed or cut
+    assert clusters(boxes(([0, 0, 0], [4, 4, 4])), boxes(([1, 1, 1], [2, 2, 2]))) == [[0, 1]]
+
+
+def testClustersFollowChainsOfContact():
+    meshes = [
+        boxes(([0, 0, 0], [1, 1, 1])),
+        boxes(([5, 0, 0], [6, 1, 1])),
+        boxes(([0.5, 0.5, 0.5], [1.5, 1.5, 1.5])),
+        boxes(([1.2, 1.2, 1.2], [2, 2, 2])),
+    ]
+    assert clusters(*meshes) == [[0, 2, 3], [1]]
+
+
+def testOverlappingBoundsWithFacesApart():
+    # two cubes far apart in one mesh, a box in the gap between them poking out of their bounds
+    apart = boxes(([0, 0, 0], [1, 1, 1]), ([4, 0, 0], [5, 1, 1]))
+    inGap = boxes(([2, -1, 0], [3, 0.5, 1]))
+    assert clusters(apart, inGap) == [[0], [1]]
+
+
+def testStraddlingBoxIntersects():
+    apart = boxes(([0, 0, 0], [1, 1, 1]), ([4, 0, 0], [5, 1, 1]))
+    straddling = boxes(([3.5, -1, 0.25], [4.5, 0.5, 0.75]))
+    assert clusters(apart, straddling) == [[0, 1]]
+
+
+def testEmptyMeshOverlapsNothing():
+    empty = (np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64))
+    assert clusters(boxes(([0, 0, 0], [1, 1, 1])), empty) == [[0], [1]]
@@ -34,11 +34,20 @@ bl_info = {
 
 
 import re
+import argparse
+import base64
 import bpy
+import hashlib
+import json
 import mathutils
 import operator
+import os
+import struct
+import sys
 import time
+import traceback
 import bmesh
+import numpy as np
 from datetime import datetime
 from bpy_extras.io_utils import ExportHelper
 
@@ -106,6 +115,34 @@ class ExportTroveJSON(bpy.types.Operator, ExportHelper):
             name="subsurf_iters_browser"
             )
 
+    export_binary = bpy.props.BoolProperty(
+            name="Write binary companion",
+            description="Also write the geometry as a .bin file that blendlib can load without parsing",
+            default=True
+            )
+
+    export_cage = bpy.props.BoolProperty(
+            name="Export subdivision cage",
+            description="Write meshes before their trailing subdivision surface, for blendlib to subdivide at export",
+            default=False
+            )
+
+    format_version = bpy.props.IntProperty(
+            name="Format version",
+            description="6 writes plain number arrays, 7 packed fixed-point arrays several times smaller",
+            default=6,
+            min=6,
+            max=7
+            )
+
+    quantize_precision = bpy.props.FloatProperty(
+            name="Precision",
+            description="Largest error of a position or displacement in format version 7, in model units",
+            default=0.0001,
+            min=0.000001,
+            precision=6
+            )
+
     def execute(self, context):
         scene = context.scene
 
@@ -198,22 +235,65 @@ def export(operator, context, blendObjects):
     if diameterMeshObject:
         modelDiameter = calculateDiameter(diameterMeshObject)
 
-    meshString = generate_meshes(blendObjects, scene)
-    operatorString = generate_operators(blendObjects, scene)
-
     controlString = generate_controls()
 
+    # formatVersion 7 declares the error bound of its fixed-point arrays, 6 has no quantization
+    precision = None
+    precisionString = ""
+    formatVersion = operator.properties.format_version
+    if formatVersion >= QUANTIZED_FORMAT_VERSION:
+        # blender float properties are single precision, keep the value as it was typed
+        precision = float("%g" % operator.properties.quantize_precision)
+        precisionString = TEMPLATE_PRECISION % precision
+
     fileName = bpy.path.basename(bpy.context.blend_data.filepath)
     modelCategory = getModelCategory(fileName)
     metadataString = TEMPLATE_METADATA % {
                 "modelDiameter": modelDiameter,
                 "modelCategory": addQuotes(modelCategory),
+                "formatVersion": formatVersion,
+                "precision": precisionString,
                 "sourceFilename": addQuotes(fileName),
                 "timestamp": addQuotes(exportTime)
             }
-    fileText = generate_file(metadataString, meshString, operatorString, controlString)
-
-    write_file(filepath, fileText)
+    modelText = generate_file(metadataString, STREAM_SLOT, STREAM_SLOT, controlString)
+
+    # meshes and operators go to the file as they are extracted, only the binary companion's
+    # arrays are kept until the end
+    companion = None
+    if operator.properties.export_binary:
+        companion = BinaryCompanion(modelText)
+
+    # cage meshes and morphs are extracted with the subdivision hidden
+    cageLevels = {}
+    hiddenModifiers = []
+    if operator.properties.export_cage:
+        cageLevels, hiddenModifiers = hide_cage_subdivision(blendObjects)
+
+    # streamed into a file beside the destination and moved over it once complete, so a failed
+    # export leaves the previous model in place rather than a truncated one
+    tempPath = "%s.%d.tmp" % (filepath, os.getpid())
+    out = None
+    try:
+        out = open(tempPath, "w")
+        head, between, tail = modelText.split(STREAM_SLOT)
+        out.write(head)
+        write_meshes(out, blendObjects, scene, companion, precision, cageLevels)
+        out.write(between)
+        write_operators(out, blendObjects, scene, companion, precision)
+        out.write(tail)
+        out.close()
+        os.replace(tempPath, filepath)
+    finally:
+        if out:
+            out.close()
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        for mod in hiddenModifiers:
+            mod.show_viewport = True
+
+    if companion:
+        companion.write(binary_companion_path(filepath), file_md5(filepath))
 
     return {'FINISHED'}
 
@@ -250,10 +330,119 @@ def calculateDiameter(obj):
     print("didn't find at least two vertices, found: "+str(foundVerts))
     return 0
 
-def write_file(fname, content):
-    out = open(fname, "w")
-    out.write(content)
-    out.close()
+# stands in for the arrays and lists of a filled template, which are written in its place
+STREAM_SLOT = "\0"
+
+# rows per formatting block, keeps the temporary strings of huge meshes bounded
+NUMBER_BLOCK_ROWS = 65536
+
+# comma separated text of the rows, a block at a time with a single % per block; template is the
+# text of one row, or an array with the template of each row
+def format_rows(rows, template):
+    templates = np.resize(np.asarray(template), len(rows))
+    for start in range(0, len(rows), NUMBER_BLOCK_ROWS):
+        block = rows[start:start + NUMBER_BLOCK_ROWS]
+        yield ",".join(templates[start:start + NUMBER_BLOCK_ROWS].tolist()) % tuple(block.ravel().tolist())
+
+def write_rows(out, rows, template):
+    for i, text in enumerate(format_rows(rows, template)):
+        if i:
+            out.write(",")
+        out.write(text)
+
+# binary companion layout, must match readBinaryModel in blendlib.py:
+#   "TROVEBIN" | uint32 LE header length | utf-8 json header | zero padding to a multiple of 8 | data
+# the header is the json model with each numeric array below replaced by a block descriptor,
+# {"dtype", "count", "offset"}, offset counting bytes from the start of the data, plus sourceMD5,
+# the MD5 of the .json written alongside, for readers to tell when the json has changed since
+BINARY_MAGIC = b"TROVEBIN"
+BINARY_MESH_ARRAYS = (("vertices", "<f4"), ("triangles", "<i4"))
+BINARY_OPERATOR_ARRAYS = (("indices", "<i4"), ("displacements", "<f4"))
+
+# formatVersion 7 layout, must match the decoding in blendlib.py and Scene.decodeModel: each
+# numeric array is a base64 string of zigzag LEB128 varints; positions and displacements are
+# fixed-point, value = integer * scale + offset with scale twice the declared precision, triangle
+# and operator indices are differences from the previous index. The polygonSizes of cage meshes
+# stay a plain list
+QUANTIZED_FORMAT_VERSION = 7
+QUANTIZATION_KEYS = ("vertexScale", "vertexOffset", "displacementScale")
+
+def pack_integers(values):
+    values = np.asarray(values, dtype=np.int64).ravel()
+    zigzag = ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+    # 7 bits per byte, the high bit set on every byte but the last of each value
+    byteCounts = np.ones(len(zigzag), dtype=np.int64)
+    for bits in range(7, 64, 7):
+        byteCounts += zigzag >= (1 << bits)
+    owners = np.repeat(np.arange(len(zigzag)), byteCounts)
+    positions = np.arange(len(owners)) - np.repeat(np.cumsum(byteCounts) - byteCounts, byteCounts)
+    data = (zigzag[owners] >> (positions * 7).astype(np.uint64)) & np.uint64(127)
+    data |= (positions < byteCounts[owners] - 1).astype(np.uint64) << np.uint64(7)
+    return base64.b64encode(data.astype(np.uint8).tobytes()).decode("ascii")
+
+# fixed-point integers for the values and the float32 values a reader decodes from them
+def quantize(values, scale, offset=0.0):
+    quantized = np.rint((values - offset) / scale).astype(np.int64)
+    return quantized, (quantized * scale + offset).astype(np.float32)
+
+def delta_code(indices):
+    return np.diff(np.concatenate(([0], np.ravel(indices).astype(np.int64))))
+
+def file_md5(filepath):
+    digest = hashlib.md5()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def binary_companion_path(filepath):
+    return re.sub(r"\.json$", "", filepath) + ".bin"
+
+class BinaryCompanion():
+    """Header and data blocks of a binary companion, gathered as the json is written."""
+
+    def __init__(self, modelText):
+        self.model = json.loads(modelText.replace(STREAM_SLOT, ""))
+        # the companion's arrays are plain values whatever the encoding of the json
+        self.model["metadata"]["formatVersion"] = 6
+        self.blocks = []
+        self.dataLength = 0
+
+    # arrays holds the values the json reader gets for each key of arrayTypes, in that order
+    def add_mesh(self, meshText, arrays):
+        self.model["meshes"].append(self.describe(meshText, BINARY_MESH_ARRAYS, arrays))
+
+    def add_operator(self, operatorText, arrays):
+        operatorDef = self.describe(operatorText, (), ())
+        operatorDef["parameters"] = self.describe(operatorDef["parameters"], BINARY_OPERATOR_ARRAYS, arrays)
+        self.model["operators"].append(operatorDef)
+
+    def describe(self, definition, arrayTypes, arrays):
+        if isinstance(definition, str):
+            definition = json.loads(definition.replace(STREAM_SLOT, ""))
+        for key in QUANTIZATION_KEYS:
+            definition.pop(key, None)
+        for (key, dtype), values in zip(arrayTypes, arrays):
+            data = np.ascontiguousarray(values, dtype=dtype).ravel()
+            definition[key] = {"dtype": dtype, "count": len(data), "offset": self.dataLength}
+            self.blocks.append(data.tobytes())
+            self.dataLength += len(self.blocks[-1])
+        return definition
+
+    def write(self, fname, sourceMD5):
+        self.model["sourceMD5"] = sourceMD5
+        header = json.dumps(self.model, separators=(",", ":")).encode("utf-8")
+        headerEnd = len(BINARY_MAGIC) + 4 + len(header)
+
+        out = open(fname, "wb")
+        out.write(BINARY_MAGIC)
+        out.write(struct.pack("<I", len(header)))
+        out.write(header)
+        out.write(b"\0" * (-headerEnd % 8))
+        for data in self.blocks:
+            out.write(data)
+        out.close()
 
 def extract_mesh( object, scene):
     if object.type == "MESH":
@@ -271,56 +460,92 @@ def extract_mesh( object, scene):
         mesh.calc_tessface()
         return mesh
 
+# yields the mesh of each object in turn, removing it once the next one is asked for
 def extract_meshes( objects, scene ):
     print("=== pre extraction")
     dumpObjectList(objects)
 
-    meshes = []
     for ob in objects:
-        if ob.type == "MESH":
-            # collapse modifiers into mesh using the preview setting
-            # as opposed to RENDER, this matches the subdivision level of what you see in the 3D viewport
-            # bpy.context.scene.objects.active = ob
-
-            mesh = ob.to_mesh(scene, True, 'PREVIEW', calc_tessface=True)
-
-            if not mesh:
-                raise Exception("Error, could not get mesh data from object [%s]" % ob.name)
-
-            # preserve original name
-            mesh.name = ob.name
-            mesh.calc_normals()
-            mesh.calc_tessface()
-            # mesh.transform(mathutils.Matrix.Scale(1.0, 4)) # FIXME: we will probably want scaling back
-            meshes.append(mesh)
-    return meshes
-
-def generate_vertices(vertices, option_vertices_truncate, option_vertices):
-    if not option_vertices:
-        return ""
-
-    return ",".join(generate_vertex(v, option_vertices_truncate) for v in vertices)
+        mesh = extract_mesh(ob, scene)
+        if mesh:
+            yield mesh
+            bpy.data.meshes.remove(mesh)
+
+# catmull-clark subdivision surfaces at the end of an object's modifier stack, trailing
+# triangulation aside, are left to blendlib in cage exports: they are hidden so extraction yields
+# the cage polygons, returns the object name => subdivision levels and the modifiers hidden
+def hide_cage_subdivision(objects):
+    cageLevels = {}
+    hiddenModifiers = []
+    for ob in objects:
+        trailing = []
+        for mod in reversed([mod for mod in ob.modifiers if mod.show_viewport]):
+            if mod.type == "TRIANGULATE" or (mod.type == "SUBSURF" and mod.subdivision_type == "CATMULL_CLARK"):
+                trailing.append(mod)
+            else:
+                break
 
-def generate_vertex(v, option_vertices_truncate):
-    if not option_vertices_truncate:
-        return TEMPLATE_VERTEX % (v.co.x, v.co.y, v.co.z)
-    else:
-        return TEMPLATE_VERTEX_TRUNCATE % (v.co.x, v.co.y, v.co.z)
+        levels = sum(mod.levels for mod in trailing if mod.type == "SUBSURF")
+        if levels == 0:
+            continue
+        cageLevels[ob.name] = levels
+        for mod in trailing:
+            mod.show_viewport = False
+            hiddenModifiers.append(mod)
+    return cageLevels, hiddenModifiers
+
+# triangle fans of the mesh polygons, (l0, l1, l2), (l0, l2, l3) ... in polygon order, and the
+# polygon sizes, from which the polygons can be put back together
+def mesh_polygon_fans(mesh):
+    loopVerts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loopVerts)
+    loopStarts = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loopStarts)
+    loopTotals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loopTotals)
+
+    fanCounts = loopTotals - 2
+    owners = np.repeat(np.arange(len(loopStarts)), fanCounts)
+    corners = np.arange(len(owners)) - np.repeat(np.cumsum(fanCounts) - fanCounts, fanCounts) + 1
+    starts = loopStarts[owners]
+    return loopVerts[np.column_stack((starts, starts + corners, starts + corners + 1))], loopTotals
+
+def mesh_triangles(mesh):
+    faces = get_faces(mesh)
+    corners = np.empty(len(faces) * 4, dtype=np.int32)
+    faces.foreach_get("vertices_raw", corners)
+    corners = corners.reshape(-1, 4)
+
+    # tessellation never leaves vertex 0 in the fourth corner of a quad, a zero there is a triangle
+    if np.any(corners[:, 3]):
+        raise Exception("Error, mesh must be triangulated or its object must have a triangulation modifier at time of export.")
+    return corners[:, :3]
 
 TEMPLATE_VERTEX = "%g,%g,%g"
 TEMPLATE_VERTEX_TRUNCATE = "%d,%d,%d"
+TEMPLATE_FACE = "%d,%d,%d"
 TEMPLATE_N = "%g,%g,%g"
 TEMPLATE_UV = "%g,%g"
 TEMPLATE_C = "%d"
 
+# writes the operators found among the objects as they are generated
+def write_operators(out, objects, scene, companion=None, precision=None):
+    for i, morph in enumerate(generate_operators(objects, scene)):
+        if i:
+            out.write(",\n")
+        write_operator(out, morph, companion, precision)
+
 # accepts a listing of each mesh in the scene and its object as a tuple
-# return the text of the operators found among the objects
+# yields the (object, morph name, indices, displacements) of the operators found among the objects
 def generate_operators(objects, scene):
-    operators = []
     for ob in objects:
         if not ob.data.shape_keys:
             continue
 
+        if shape_keys_direct(ob):
+            yield from generate_morphs_direct(ob)
+            continue
+
         mesh = extract_mesh(ob, scene)
 
         addShapeKeyFrames(ob)
@@ -332,14 +557,12 @@ def generate_operators(objects, scene):
             scene.frame_set(frame, 0.0)
             morph = generate_morph(index, mesh, ob, scene)
             if morph:
-                operators.append(morph)
+                yield morph
 
         scene.frame_set(original_frame, 0.0) # restore animation state
         removeShapeKeyFrames(ob)
         bpy.data.meshes.remove(mesh)
 
-    return ",\n".join(operators)
-
 
 def resetShapekeyValueRang(ob):
     operatorLimits = {}
@@ -354,59 +577,100 @@ def resetShapekeyValueRang(ob):
     ob["operatorLimits"] = operatorLimits
 
 
+# modifiers leaving the vertices exactly as they are, so that an object's morphs are just the
+# differences between its shape keys and evaluating the modifier stack once per key is wasted
+VERTEX_PRESERVING_MODIFIERS = {"TRIANGULATE"}
+
+def shape_keys_direct(ob):
+    for mod in ob.modifiers:
+        if mod.show_viewport and mod.type not in VERTEX_PRESERVING_MODIFIERS:
+            return False
+
+    shapeKeys = ob.data.shape_keys
+    if not shapeKeys.use_relative:
+        return False
+    for sk in shapeKeys.key_blocks:
+        if sk.vertex_group:
+            return False
+    return True
+
+# the morphs generate_morph would build frame by frame, straight from the shape key data
+def generate_morphs_direct(ob):
+    keyBlocks = ob.data.shape_keys.key_blocks
+    keyCoords = {}
+    for sk in keyBlocks:
+        coords = np.empty(len(sk.data) * 3, dtype=np.float32)
+        sk.data.foreach_get("co", coords)
+        keyCoords[sk.name] = coords.reshape(-1, 3)
+
+    # with every key at 0 the mesh evaluates to the reference key, and with one key at 1 to the
+    # reference plus that key's offset from its relative key, all in single precision like blender
+    basis = keyCoords[ob.data.shape_keys.reference_key.name]
+    for sk in keyBlocks:
+        if sk.name == "Basis":
+            continue # redundant with the main mesh vertices
+
+        deformed = basis
+        if not sk.mute:
+            deformed = basis + (keyCoords[sk.name] - keyCoords[sk.relative_key.name])
+        indices, displacements = diff_vertices(basis, deformed)
+        yield ob, sk.name, indices, displacements
+
+def mesh_coordinates(mesh):
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    return coords.reshape(-1, 3)
+
+# indices of the vertices that moved by more than epsilon and their displacements, zeroing near-zero
+# components; same numbers as the mathutils per-vertex loop this replaces
+def diff_vertices(originalCoords, deformedCoords, epsilon=.0001):
+    delta = deformedCoords - originalCoords
+
+    # Vector.length squares each float component in single precision and sums them, z first, in double
+    squares = (delta * delta).astype(np.float64)
+    lengths = np.sqrt(squares[:, 2] + squares[:, 1] + squares[:, 0])
+    moved = np.flatnonzero(lengths > epsilon)
+
+    components = delta[moved].astype(np.float64)
+    return moved, np.where(np.abs(components) > epsilon, components, 0.0)
+
 # builds the morph target for the object at the global scene frame already set
 def generate_morph(frameIndex, originalMesh, object, scene):
     if not object.data.shape_keys:
         return None # no shape keys
 
-    epsilon = .0001
     morphName = object.data.shape_keys.key_blocks[frameIndex].name
 
     if morphName == "Basis":
         return None # redundant with the main mesh vertices
 
-    # print("Examining object: ", object.name)
-    limits = object["operatorLimits"][morphName]
-    minWeight = limits[0]
-    maxWeight = limits[1]
-    # print("sentinel values:", minWeight, "--", maxWeight)
-
-    originalVertices = originalMesh.vertices[:]
     deformedMesh = extract_mesh(object, scene)
-    deformedVertices = deformedMesh.vertices[:]
 
-    # print("original vertex data: ")
-    # dumpVertexList(originalVertices)
-
-    # print("deformed vertex data: ")
-    # dumpVertexList(deformedVertices)
-
-    if len(deformedVertices) != len(originalVertices):
-        print( "Original to deformed: "+ str(len(originalVertices))+" => "+ str(len(deformedVertices)))
+    if len(deformedMesh.vertices) != len(originalMesh.vertices):
+        print( "Original to deformed: "+ str(len(originalMesh.vertices))+" => "+ str(len(deformedMesh.vertices)))
         raise Exception("Error, mismatch between number of vertices in morph" )
 
-    indices = []
-    displacements = []
-    for vertexIndex in range(len(originalVertices)):
+    # TODO: normals stored per face, need to calc per-vertex normals ourself (or learn the BMesh library, probably better)
+    # deformedMesh.polygons[0].normal
+    indices, displacements = diff_vertices(mesh_coordinates(originalMesh), mesh_coordinates(deformedMesh))
 
-        delta = deformedVertices[vertexIndex].co - originalVertices[vertexIndex].co
+    bpy.data.meshes.remove(deformedMesh)
+    return object, morphName, indices, displacements
 
-        # TODO: normals stored per face, need to calc per-vertex normals ourself (or learn the BMesh library, probably better)
-        # deformedMesh.polygons[0].normal
-        if delta.length > epsilon:
-            # clamp near-zero values
-            dx = delta.x if abs(delta.x) > epsilon else 0
-            dy = delta.y if abs(delta.y) > epsilon else 0
-            dz = delta.z if abs(delta.z) > epsilon else 0
+def write_operator(out, morph, companion=None, precision=None):
+    object, morphName, indices, displacements = morph
 
-            indices.append(str(vertexIndex))
-            displacements.extend((str(dx), str(dy), str(dz)))
+    # print("Examining object: ", object.name)
+    limits = object["operatorLimits"][morphName]
+    minWeight = limits[0]
+    maxWeight = limits[1]
+    # print("sentinel values:", minWeight, "--", maxWeight)
 
     meshID, channelID, meshLabel, channelLabel = unpackMeshName(object.name)
     operatorID, groupID, operatorLabel, groupLabel = unpackOperatorName(morphName, meshID)
 
     operatorID = operatorID + "_" + meshID
-    morphTarget = TEMPLATE_OPERATOR % {
+    fields = {
             "operatorID": addQuotes(operatorID),
             "operatorLabel": addQuotes(operatorLabel),
             "groupID": addQuotes(groupID),
@@ -416,15 +680,35 @@ def generate_morph(frameIndex, originalMesh, object, scene):
             "minWeight": minWeight,
             "maxWeight": maxWeight,
             "modifiedCount": len(indices),
-            "indices": ",".join(indices),
-            "displacements": ",".join(displacements)
+            "indices": STREAM_SLOT,
+            "displacements": STREAM_SLOT
             }
+    components = displacements.ravel()
+
+    if precision:
+        fields["displacementScale"] = 2 * precision
+        operatorText = TEMPLATE_OPERATOR_QUANTIZED % fields
+        quantized, components = quantize(components, fields["displacementScale"])
+
+        head, between, tail = operatorText.split(STREAM_SLOT)
+        out.write(head)
+        out.write(pack_integers(delta_code(indices)))
+        out.write(between)
+        out.write(pack_integers(quantized))
+        out.write(tail)
+    else:
+        operatorText = TEMPLATE_OPERATOR % fields
 
-    # object.data.shape_keys.key_blocks[frameIndex].slider_min = minWeight
-    # object.data.shape_keys.key_blocks[frameIndex].slider_max = maxWeight
+        head, between, tail = operatorText.split(STREAM_SLOT)
+        out.write(head)
+        write_rows(out, indices, TEMPLATE_C)
+        out.write(between)
+        # clamped components are written as a plain 0
+        write_rows(out, components, np.where(components != 0, "%r", "%d"))
+        out.write(tail)
 
-    bpy.data.meshes.remove(deformedMesh)
-    return morphTarget
+    if companion:
+        companion.add_operator(operatorText, (indices, components))
 
 # populate frames 1 - len()
 # this function exists largely unmodified from original mixee hack
@@ -507,35 +791,79 @@ def extractDiameter(objects):
     return 0
 
 
-# accepts a list of <mesh, object> tuples, each mesh should be a separate component
-# return the text of the mesh components in the scene
-def generate_meshes(objects, scene):
-    meshList = extract_meshes(objects, scene)
-
-    meshStrings = []
-    for mesh in meshList:
+# accepts a list of objects, each mesh should be a separate component
+# writes the mesh components in the scene one at a time
+def write_meshes(out, objects, scene, companion=None, precision=None, cageLevels=None):
+    written = 0
+    for mesh in extract_meshes(objects, scene):
         if mesh.name in nameExportBlacklist:
             continue
-        meshStrings.append(generate_mesh(mesh))
-
-    return ",\n".join(meshStrings)
+        if written:
+            out.write(",\n")
+        write_mesh(out, mesh, companion, precision, (cageLevels or {}).get(mesh.name, 0))
+        written += 1
 
-def generate_mesh(mesh):
-    vertices = mesh.vertices[:]
-    triangle_string, nTris = generate_faces(mesh)
+def write_mesh(out, mesh, companion=None, precision=None, subdivisionLevels=0):
+    coords = mesh_coordinates(mesh)
     meshID, channelID, meshLabel, channelLabel = unpackMeshName(mesh.name)
 
-    return TEMPLATE_MESH % {
+    subdivisionString = ""
+    if subdivisionLevels:
+        triangles, polygonSizes = mesh_polygon_fans(mesh)
+        subdivisionString = TEMPLATE_SUBDIVISION % {
+                "levels": subdivisionLevels,
+                "polygonSizes": ",".join(format_rows(polygonSizes, TEMPLATE_C))
+                }
+    else:
+        triangles = mesh_triangles(mesh)
+
+    fields = {
             "meshID"    : addQuotes(meshID),
             "channelID" : addQuotes(channelID),
             "meshLabel" : addQuotes(meshLabel),
             "channelLabel": addQuotes(channelLabel),
-            "nvertex"   : len(vertices),
-            "ntriangle" : nTris,
-            "vertices"  : generate_vertices(vertices, False, True),
-            "triangles" : triangle_string
+            "nvertex"   : len(coords),
+            "ntriangle" : len(triangles),
+            "subdivision": subdivisionString,
+            "vertices"  : STREAM_SLOT,
+            "triangles" : STREAM_SLOT
             }
 
+    if precision:
+        # offsetting by the lower corner keeps the integers, and so their varints, small
+        offset = coords.min(axis=0).astype(np.float64) if len(coords) else np.zeros(3)
+        fields["vertexScale"] = 2 * precision
+        fields["vertexOffset"] = ",".join(map(repr, offset.tolist()))
+        meshText = TEMPLATE_MESH_QUANTIZED % fields
+        quantized, readVertices = quantize(coords, fields["vertexScale"], offset)
+
+        head, between, tail = meshText.split(STREAM_SLOT)
+        out.write(head)
+        out.write(pack_integers(quantized))
+        out.write(between)
+        out.write(pack_integers(delta_code(triangles)))
+        out.write(tail)
+    else:
+        meshText = TEMPLATE_MESH % fields
+
+        head, between, tail = meshText.split(STREAM_SLOT)
+        out.write(head)
+        # the binary companion gets the vertices as a reader of the rounded text does
+        readBlocks = [np.empty(0)]
+        for i, text in enumerate(format_rows(coords, TEMPLATE_VERTEX)):
+            if i:
+                out.write(",")
+            out.write(text)
+            if companion:
+                readBlocks.append(np.fromstring(text, sep=","))
+        out.write(between)
+        write_rows(out, triangles, TEMPLATE_FACE)
+        out.write(tail)
+        readVertices = np.concatenate(readBlocks)
+
+    if companion:
+        companion.add_mesh(meshText, (readVertices, triangles))
+
 def generate_controls():
     if 'raw_controls' in bpy.data.texts:
         return bpy.data.texts['raw_controls'].as_string()
@@ -571,10 +899,18 @@ TEMPLATE_MODEL = """\
 TEMPLATE_METADATA = """\
         "diameter"      : %(modelDiameter)f,
         "category"      : %(modelCategory)s,
-        "formatVersion" : 6,
+        "formatVersion" : %(formatVersion)d,%(precision)s
         "sourceFile"    : %(sourceFilename)s,
         "dateGenerated" : %(timestamp)s """
 
+TEMPLATE_PRECISION = """
+        "precision"     : %r,"""
+
+# cage meshes, their triangles being fans of the polygons listed by size
+TEMPLATE_SUBDIVISION = """
+            "subdivisionLevels": %(levels)d,
+            "polygonSizes"  : [%(polygonSizes)s],"""
+
 TEMPLATE_MESH = """\
         {
             "id"            : %(meshID)s,
@@ -582,11 +918,25 @@ TEMPLATE_MESH = """\
             "channelID"     : %(channelID)s,
             "channelLabel"  : %(channelLabel)s,
             "numvertices"   : %(nvertex)d,
-            "numtriangles"  : %(ntriangle)d,
+            "numtriangles"  : %(ntriangle)d,%(subdivision)s
             "vertices"      : [%(vertices)s],
             "triangles"     : [%(triangles)s]
         }"""
 
+TEMPLATE_MESH_QUANTIZED = """\
+        {
+            "id"            : %(meshID)s,
+            "label"         : %(meshLabel)s,
+            "channelID"     : %(channelID)s,
+            "channelLabel"  : %(channelLabel)s,
+            "numvertices"   : %(nvertex)d,
+            "numtriangles"  : %(ntriangle)d,%(subdivision)s
+            "vertexScale"   : %(vertexScale)r,
+            "vertexOffset"  : [%(vertexOffset)s],
+            "vertices"      : "%(vertices)s",
+            "triangles"     : "%(triangles)s"
+        }"""
+
 TEMPLATE_CONTROL = """\
         {
             "id": %(operatorID)s,
@@ -619,6 +969,24 @@ TEMPLATE_OPERATOR = """\
             }
         }"""
 
+TEMPLATE_OPERATOR_QUANTIZED = """\
+        {
+            "id": %(operatorID)s,
+            "label": %(operatorLabel)s,
+            "groupID": %(groupID)s,
+            "groupLabel": %(groupLabel)s,
+            "type": %(type)s,
+            "mesh": %(meshID)s,
+            "minWeight": %(minWeight)f,
+            "maxWeight": %(maxWeight)f,
+            "parameters": {
+                "modifiedCount": %(modifiedCount)d,
+                "displacementScale": %(displacementScale)r,
+                "indices": "%(indices)s",
+                "displacements": "%(displacements)s"
+            }
+        }"""
+
 
 def bbox(vertices):
     """Compute bounding box of vertex array."""
@@ -657,30 +1025,6 @@ def setBit(value, position, on):
         mask = ~(1 << position)
         return (value & mask)
 
-def generate_faces(mesh):
-    vertex_offset = 0
-    chunks = []
-    for i, f in enumerate(get_faces(mesh)):
-        face = generate_face(f, vertex_offset)
-        chunks.append(face)
-
-    return ",".join(chunks), len(chunks)
-
-def generate_face(f, vertex_offset):
-    isTriangle = ( len(f.vertices) == 3 )
-
-    if isTriangle:
-        nVertices = 3
-    else:
-        raise Exception("Error, mesh must be triangulated or its object must have a triangulation modifier at time of export.")
-
-    faceData = []
-    for i in range(nVertices):
-        index = f.vertices[i] + vertex_offset
-        faceData.append(index)
-
-    return ",".join( map(str, faceData) )
-
 # #####################################################
 # Utils
 # #####################################################
@@ -705,6 +1049,37 @@ def ensure_extension(filepath, extension):
         filepath += extension
     return filepath
 
+def export_from_command_line(argv):
+    """Export the open .blend with the operator's settings taken from the arguments after "--",
+    for batch_export.py's background runs. Returns the process exit status."""
+    parser = argparse.ArgumentParser(prog="trove_export.py", description="Export the open .blend as a Trove model")
+    parser.add_argument("--output", required=True, help="path of the .json to write")
+    parser.add_argument("--format-version", type=int, default=6, choices=(6, QUANTIZED_FORMAT_VERSION))
+    parser.add_argument("--precision", type=float, default=0.0001, help="quantization error bound of format version 7")
+    parser.add_argument("--cage", action="store_true", help="export meshes before their trailing subdivision")
+    parser.add_argument("--no-binary", action="store_true", help="skip the .bin companion")
+    args = parser.parse_args(argv)
+
+    # the operator's shape_key_clear and transform_apply need an active object to poll
+    scene = bpy.context.scene
+    if scene.objects.active is None:
+        scene.objects.active = next((ob for ob in scene.objects if ob.type == 'MESH'), None)
+
+    try:
+        bpy.ops.object.trove_export(
+            filepath=args.output,
+            format_version=args.format_version,
+            quantize_precision=args.precision,
+            export_cage=args.cage,
+            export_binary=not args.no_binary)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
 if __name__ == "__main__":
     register()
+    # blender -b model.blend --python trove_export.py -- --output model.json [options]
+    if bpy.app.background and "--" in sys.argv:
+        sys.exit(export_from_command_line(sys.argv[sys.argv.index("--") + 1:]))
 
@@ -28,6 +28,36 @@ var baseConfig = {
   environment: 'compute',
 
   exportPath: "./build/",
+
+  // pipe exports from blender straight into the bucket upload instead of going through a temp file
+  streamExports: false,
+
+  // exports whose meshes need no boolean union skip blender and run blender-scripts/nplib.py with
+  // this python (which needs numpy) instead; jobs it turns down or fails to run go to blender,
+  // and models it turned down once skip it from then on. false sends every export to blender
+  numpyExports: {
+    python: "python3"
+  },
+
+  // finished exports are reused for identical requests, least recently used evicted past maxBytes;
+  // operator weights closer together than weightPrecision are considered identical
+  exportCache: {
+    dir: "./temp/export-cache",
+    maxBytes: 512 * 1024 * 1024,
+    weightPrecision: 0.001
+  },
+
+  // load models from the .bin companion trove_export writes next to each .json when it exists,
+  // falling back to the json; with a downloadCache the companion is memory mapped, not read
+  binaryModels: true,
+
+  // downloaded models are kept locally and revalidated with their ETag; within maxAge seconds
+  // of the last validation they are used without asking the bucket at all
+  downloadCache: {
+    dir: "./temp/download-cache",
+    maxBytes: 256 * 1024 * 1024,
+    maxAge: 60
+  },
   /*
     dataBackend can be 'datastore', 'cloudsql', or 'mongodb'. Be sure to
     configure the appropriate settings for each storage engine below.
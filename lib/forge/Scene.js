@@ -92,10 +92,73 @@ function getOperatorsForExport(exportData, sizeValue, materialValue) {
     return operators;
 }
 
+/* Models of formatVersion 7 pack each numeric array into a base64 string of zigzag varints, with
+ * positions and displacements as fixed-point integers (value = integer * scale + offset) and
+ * triangle and operator indices as differences from the previous index, see trove_export.py.
+ * Unpacks them in place into the plain arrays of earlier versions; other models pass through.
+ **/
+Scene.decodeModel = function(model) {
+    if (!(model.metadata.formatVersion >= 7)) {
+        return model;
+    }
+
+    model.meshes.map(function(meshSpec) {
+        meshSpec.vertices = decodeFixedPoint(meshSpec.vertices, meshSpec.vertexScale, meshSpec.vertexOffset);
+        meshSpec.triangles = decodeDeltas(meshSpec.triangles);
+    });
+
+    model.operators.map(function(op) {
+        var params = op.parameters;
+        params.indices = decodeDeltas(params.indices);
+        params.displacements = decodeFixedPoint(params.displacements, params.displacementScale, [0]);
+    });
+    return model;
+};
+
+// values above 2^31 are possible, so the bits are accumulated with arithmetic instead of shifts
+function unpackIntegers(text) {
+    var bytes = atob(text);
+    var values = [];
+    var value = 0, scale = 1;
+
+    for (var i = 0; i < bytes.length; i++) {
+        var b = bytes.charCodeAt(i);
+        value += (b & 127) * scale;
+        scale *= 128;
+        if (b < 128) {
+            values.push(value % 2 ? -(value + 1) / 2 : value / 2);
+            value = 0;
+            scale = 1;
+        }
+    }
+    return values;
+}
+
+function decodeFixedPoint(text, scale, offset) {
+    var integers = unpackIntegers(text);
+    var values = new Float32Array(integers.length);
+    for (var i = 0; i < integers.length; i++) {
+        values[i] = integers[i] * scale + offset[i % offset.length];
+    }
+    return values;
+}
+
+function decodeDeltas(text) {
+    var deltas = unpackIntegers(text);
+    var indices = new Uint32Array(deltas.length);
+    var index = 0;
+    for (var i = 0; i < deltas.length; i++) {
+        index += deltas[i];
+        indices[i] = index;
+    }
+    return indices;
+}
+
 // grouping data in preparation for the next model. Think of it as a repeatable init function.
 function parseModel(model) {
     var that = this;
     that.reset();
+    Scene.decodeModel(model);
 
     that.setConfig("diameter", model.metadata.diameter);
     that.setConfig("category", model.metadata.category);
@@ -4,6 +4,7 @@ var path = require('path');
 var express = require('express');
 var bodyParser = require('body-parser');
 var storage = require('./storage');
+var Blender = require('./blender');
 var fs = require('fs');
 var https = require('https');
 var config = require('../config/config.js');
@@ -12,13 +13,24 @@ var cors = require('cors');
 
 var appPath = (process.env.PWD == null ? __dirname : process.env.PWD);
 
-var spawn;
-var useSync = true;
-if (useSync) {
-    spawn = require('child_process').spawnSync;
-} else {
-    spawn = require('child_process').spawn;
-}
+// one persistent blender process per node worker, started on the first export
+var blenderWorker = Blender.createWorker("blendlib");
+// jobs without a boolean union are exported by plain numpy when enabled, see config.numpyExports
+var numpyWorker = config.numpyExports ? Blender.createWorker("nplib", config.numpyExports.python, true) : null;
+
+// model and visible meshes of jobs nplib turned down, sent straight to blender from then on. Weights
+// can change whether meshes intersect, but a model that needed a union once almost always will again
+var blenderVerdicts = {};
+var blenderVerdictCount = 0;
+var MAX_BLENDER_VERDICTS = 10000;
+
+// consecutive nplib worker failures after which numpy exports are given up on, a python without
+// numpy or a broken interpreter fails every job and would only delay each one on its way to blender
+var numpyWorkerFailures = 0;
+var MAX_NUMPY_WORKER_FAILURES = 3;
+
+// what blendlib can write, checked before the format becomes part of a temporary file name
+var EXPORT_FORMATS = ["obj", "stl", "ply"];
 
 
 module.exports = function(){
@@ -84,6 +96,7 @@ module.exports = function(){
      * @exportBucket - similar to importBucket
      * @exportPath - similar to importPath
      * @enableRender - whether to include normals and apply textual CSG
+     * @format - output file format, one of "obj" (default), "stl" (binary) or "ply" (binary)
      */
     app.post('/api/export', function(request, response) {
         var opts = request.body;
@@ -99,26 +112,65 @@ module.exports = function(){
         opts.operators = opts.operators || [];
         opts.modelName = path.basename(opts.modelURL);
         opts.enableRender = !!opts.enableRender;
+        opts.format = opts.format || "obj";
 
-        // the path where blender will deposit the generated OBJ for upload by node
-        opts.tempPath = generateTemporaryPath().replace('.json', '.obj');
+        if (EXPORT_FORMATS.indexOf(opts.format) < 0) {
+            response.json(buildExportResponse(opts, new Error("Unsupported export format " + JSON.stringify(opts.format)), null, null));
+            return;
+        }
+
+        // the path where blender will deposit the generated model for upload by node, unused when streaming
+        opts.tempPath = generateTemporaryPath().replace('.json', '.' + opts.format);
 
-        // download json file to local temp path
-        // TODO: local cache of most used models?
+        // blender keeps its own conditional-GET cache of the downloaded models, see config.downloadCache
         var exportBucketHandle = storage.getBucketHandle(opts.exportBucket, config.environment); // FIXME: this needs to be based on environment
-        var blendResult = execBlenderModule("blendlib", opts);
+        var invocation = buildBlenderInvocation(opts);
+
+        if (config.streamExports) {
+            // upload the export as blender produces it, no temp file involved
+            var upload = storage.createUploadStream(exportBucketHandle, opts.exportPath);
+            var blendDone = false, uploadDone = false;
+            var blendErr = null, blendResult = null, uploadErr = null;
+            var respond = function() {
+                if (blendDone && uploadDone) {
+                    response.json(buildExportResponse(opts, blendErr, blendResult, uploadErr));
+                }
+            };
 
-        storage.uploadFileToBucket(exportBucketHandle, opts.tempPath, opts.exportPath, function(err, file, apiResponse){
-            fs.unlinkSync(opts.tempPath);
+            upload.on('finish', function() {
+                uploadDone = true;
+                respond();
+            });
+            upload.on('error', function(err) {
+                if (uploadDone) {
+                    return;
+                }
+                uploadDone = true;
+                uploadErr = err;
+                respond();
+            });
 
-            var hash = {
-                sourceModel: opts.modelName,
-                exportURL: opts.exportURL,
-                errorCode: blendResult.code,
-                success: !err,
-                msg: err ? 'Model upload failure with message: ' + err.message : "",
-            };
-            response.json(hash);
+            submitExport(invocation, function(err, result) {
+                blendDone = true;
+                blendErr = err;
+                blendResult = result;
+                respond();
+            }, upload);
+            return;
+        }
+
+        submitExport(invocation, function(blendErr, blendResult) {
+            if (blendErr || !blendResult.completed) {
+                // a failed export can leave a partly written file behind
+                fs.unlink(opts.tempPath, function() {});
+                response.json(buildExportResponse(opts, blendErr, blendResult, null));
+                return;
+            }
+
+            storage.uploadFileToBucket(exportBucketHandle, opts.tempPath, opts.exportPath, function(err, file, apiResponse){
+                fs.unlinkSync(opts.tempPath);
+                response.json(buildExportResponse(opts, null, blendResult, err));
+            });
         });
     });
 
@@ -183,26 +235,102 @@ module.exports = function(){
     return app;
 };
 
-// NB: synchronous
-function execBlenderModule(module, opts) {
-    var bigArg = {
+// run an export on the numpy worker if there is one, falling back to blender for the jobs it turns
+// down and for those it failed to run at all, as long as their output stream is still untouched
+function submitExport(invocation, cb, output) {
+    var verdictKey = blenderVerdictKey(invocation);
+    if (!numpyWorker || blenderVerdicts[verdictKey]) {
+        blenderWorker.submit(invocation, cb, output);
+        return;
+    }
+
+    numpyWorker.submit(invocation, function(err, result) {
+        if (err) {
+            numpyWorkerFailures++;
+            if (numpyWorkerFailures >= MAX_NUMPY_WORKER_FAILURES && numpyWorker) {
+                console.log("Numpy worker failed " + numpyWorkerFailures + " jobs in a row, exporting with blender only");
+                numpyWorker = null;
+            }
+            if (!output || err.outputReleased) {
+                blenderWorker.submit(invocation, cb, output);
+                return;
+            }
+            cb(err, result);
+            return;
+        }
+
+        numpyWorkerFailures = 0;
+        if (result.needsBlender) {
+            recordBlenderVerdict(verdictKey);
+            blenderWorker.submit(invocation, cb, output);
+            return;
+        }
+        cb(err, result);
+    }, output);
+}
+
+// what decides whether nplib can take a job: the model, the meshes shown and, for the necklace
+// chain added to renders, the size category
+function blenderVerdictKey(invocation) {
+    var visible = (invocation.visible || []).slice().sort();
+    var sizeCategory = String(invocation.size).split("_")[0];
+    return JSON.stringify([invocation.modelURL, visible, sizeCategory, !!invocation.enableRender]);
+}
+
+function recordBlenderVerdict(verdictKey) {
+    if (blenderVerdictCount >= MAX_BLENDER_VERDICTS) {
+        blenderVerdicts = {};
+        blenderVerdictCount = 0;
+    }
+    blenderVerdicts[verdictKey] = true;
+    blenderVerdictCount++;
+}
+
+function buildBlenderInvocation(opts) {
+    return {
         enableRender: opts.enableRender,
         modelURL: opts.modelURL,
         localPath: path.resolve(opts.tempPath),
         size: opts.size,
         visible: opts.visible,
         importBucket: opts.importBucket,
-        operators: opts.operators
+        operators: opts.operators,
+        format: opts.format,
+        exportCache: config.exportCache,
+        downloadCache: config.downloadCache,
+        binaryModels: config.binaryModels
     };
-    var blendArgs = ["--background", "--python", "blender-scripts/"+module+".py", "--", JSON.stringify(bigArg)];
-    var execResult = spawn('blender', blendArgs);
-    console.log("Output: "+ execResult.stdout);
-    console.log("Error: "+execResult.stderr);
-    return execResult;
 }
 
 
 
+function buildExportResponse(opts, blendErr, blendResult, uploadErr) {
+    if (blendErr || !blendResult.completed) {
+        return {
+            sourceModel: opts.modelName,
+            exportURL: opts.exportURL,
+            errorCode: 1,
+            success: false,
+            msg: 'Model export failure with message: ' + (blendErr ? blendErr.message : blendResult.error),
+            trace: blendResult ? blendResult.trace : undefined
+        };
+    }
+
+    return {
+        sourceModel: opts.modelName,
+        exportURL: opts.exportURL,
+        errorCode: 0,
+        cache: blendResult.cache,
+        format: blendResult.format,
+        byteSize: blendResult.byteSize,
+        triangleCount: blendResult.triangleCount,
+        duration: blendResult.duration,
+        trace: blendResult.trace,
+        success: !uploadErr,
+        msg: uploadErr ? 'Model upload failure with message: ' + uploadErr.message : ""
+    };
+}
+
 function generateTemporaryPath() {
     var guid = 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, function(c) {
         var r = crypto.randomBytes(1)[0]%16|0, v = c == 'x' ? r : (r&0x3|0x8);
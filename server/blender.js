@@ -0,0 +1,223 @@
+var spawn = require('child_process').spawn;
+var readline = require('readline');
+
+// must match RESULT_PREFIX, EXPORT_FRAME_ABORT and the outputFD convention in blender-scripts/blendlib.py
+var RESULT_PREFIX = "TROVE_RESULT:";
+var FRAME_ABORT = 0xFFFFFFFF;
+var STREAM_FD = 3;
+
+var Blender = module.exports;
+
+/*
+ * A long-lived blender process running one of the blender-scripts modules in worker mode. Jobs are
+ * written to its stdin as newline-delimited JSON and answered in order, one tagged result line per
+ * job, so blender startup and python imports are paid once rather than per request. The process
+ * is (re)started lazily whenever a job is submitted without a live worker.
+ *
+ * Jobs submitted with an output stream have their exported file framed over an extra pipe (fd 3 in
+ * blender) and written into that stream as it is produced, instead of landing in a temp file.
+ *
+ * @module - name of the script in blender-scripts
+ * @python - optional python interpreter to run the module with instead of blender, for modules
+ *     that do not need bpy
+ * @releaseOutputs - optional, when the worker dies before writing anything into a job's output
+ *     stream, leave the stream untouched and set outputReleased on the job's error, for the caller
+ *     to retry the job on another worker
+ */
+Blender.createWorker = function(module, python, releaseOutputs) {
+    var that = {
+        module: module,
+        python: python,
+        releaseOutputs: !!releaseOutputs,
+        child: null,
+        pending: {},
+        outputs: {},
+        written: {},
+        nextJobID: 1,
+        start: start,
+        submit: submit,
+        abandon: abandon,
+        failOutput: failOutput,
+        releaseOutput: releaseOutput
+    };
+    return that;
+};
+
+function start() {
+    var that = this;
+    var script = "blender-scripts/" + this.module + ".py";
+    var child;
+    if (this.python) {
+        child = spawn(this.python, [script, "--worker"], { stdio: ['pipe', 'pipe', 'pipe', 'pipe'] });
+    } else {
+        var blendArgs = ["--background", "--python", script, "--", "--worker"];
+        child = spawn('blender', blendArgs, { stdio: ['pipe', 'pipe', 'pipe', 'pipe'] });
+    }
+    this.child = child;
+    child.stdio[STREAM_FD].on('data', createFrameReader(this));
+
+    var lines = readline.createInterface({ input: child.stdout });
+    lines.on('line', function(line) {
+        if (line.indexOf(RESULT_PREFIX) !== 0) {
+            console.log("Output: " + line);
+            return;
+        }
+
+        var result = JSON.parse(line.slice(RESULT_PREFIX.length));
+        // results come back in submission order, one the worker could not even parse answers the oldest job
+        if (result.jobID == null) {
+            result.jobID = oldestJobID(that.pending);
+        }
+        var cb = that.pending[result.jobID];
+        delete that.pending[result.jobID];
+
+        // a failed job either aborted its stream or never started it, in which case nothing more
+        // will come; anything a failed job does send afterwards finds no output and is dropped.
+        // Successful jobs always end their stream, though it may still be in flight on its own pipe.
+        // Jobs turned down with needsBlender never touched their output, it is left for the retry
+        if (result.needsBlender) {
+            that.releaseOutput(result.jobID);
+        } else if (!result.completed) {
+            that.failOutput(result.jobID, new Error("Export failed: " + result.error));
+        }
+        if (cb) {
+            cb(null, result);
+        }
+    });
+
+    child.stderr.on('data', function(data) {
+        console.log("Error: " + data);
+    });
+
+    // a missing executable is reported here rather than thrown by spawn
+    child.on('error', function(err) {
+        console.log('Worker ' + that.module + ' failed: ' + err.message);
+        that.abandon(child, "failed (" + err.message + ")");
+    });
+
+    // EPIPE when the worker dies while a job is being written to it
+    child.stdin.on('error', function(err) {
+        console.log('Worker ' + that.module + ' stdin failed: ' + err.message);
+        that.abandon(child, "stopped reading jobs (" + err.message + ")");
+    });
+
+    // 'close' rather than 'exit', so frames still buffered in the stream pipe are read first
+    child.on('close', function(code, signal) {
+        console.log('Worker ' + that.module + ' ' + child.pid + ' exited with code: ' + code + ', and signal: ' + signal);
+        that.abandon(child, "exited");
+    });
+}
+
+/*
+ * Fail everything still in flight on child, which is gone or unusable, and let the next submit
+ * start a new worker. Only the first call for a given child does anything
+ */
+function abandon(child, reason) {
+    var that = this;
+    if (this.child !== child) {
+        return;
+    }
+    this.child = null;
+    child.kill();
+
+    var pending = this.pending;
+    this.pending = {};
+    Object.keys(pending).forEach(function(jobID) {
+        var err = new Error("Blender worker " + reason + " before finishing job " + jobID);
+        if (that.releaseOutputs && that.outputs[jobID] && !that.written[jobID]) {
+            that.releaseOutput(jobID);
+            err.outputReleased = true;
+        } else {
+            that.failOutput(jobID, err);
+        }
+        pending[jobID](err);
+    });
+
+    // finished jobs whose stream never ended
+    Object.keys(this.outputs).forEach(function(jobID) {
+        that.failOutput(jobID, new Error("Blender worker " + reason + " before streaming job " + jobID));
+    });
+}
+
+function oldestJobID(pending) {
+    var jobIDs = Object.keys(pending).map(Number);
+    return jobIDs.length ? Math.min.apply(null, jobIDs) : null;
+}
+
+/*
+ * @job - blendlib invocation hash
+ * @cb - called with (err, result) once the job's result line arrives
+ * @output - optional writable stream, receives the exported file and is then ended, or gets an
+ *     'error' event if the export fails. This can happen before or after cb is called
+ */
+function submit(job, cb, output) {
+    if (!this.child) {
+        this.start();
+    }
+
+    job.jobID = this.nextJobID++;
+    this.pending[job.jobID] = cb;
+    if (output) {
+        job.outputFD = STREAM_FD;
+        this.outputs[job.jobID] = output;
+    }
+    this.child.stdin.write(JSON.stringify(job) + "\n");
+}
+
+function failOutput(jobID, err) {
+    var output = this.releaseOutput(jobID);
+    if (output) {
+        output.emit('error', err);
+    }
+}
+
+// stop feeding jobID's output stream without ending or failing it, returning the stream
+function releaseOutput(jobID) {
+    var output = this.outputs[jobID];
+    delete this.outputs[jobID];
+    delete this.written[jobID];
+    return output;
+}
+
+// parses the length-prefixed frames blendlib writes for streamed exports: a JSON header naming the
+// job, data frames, then an empty frame when done or the abort marker if the export failed
+function createFrameReader(worker) {
+    var buffered = new Buffer(0);
+    var outputJobID = null;
+
+    return function(chunk) {
+        buffered = Buffer.concat([buffered, chunk]);
+
+        while (buffered.length >= 4) {
+            var frameLength = buffered.readUInt32LE(0);
+            if (frameLength === FRAME_ABORT) {
+                buffered = buffered.slice(4);
+                worker.failOutput(outputJobID, new Error("Export of job " + outputJobID + " was aborted"));
+                outputJobID = null;
+                continue;
+            }
+
+            if (buffered.length < 4 + frameLength) {
+                return;
+            }
+            var frame = buffered.slice(4, 4 + frameLength);
+            buffered = buffered.slice(4 + frameLength);
+
+            // the output is looked up for every frame, it may have been failed or released meanwhile
+            var output = outputJobID === null ? null : worker.outputs[outputJobID];
+            if (outputJobID === null) {
+                var header = JSON.parse(frame.toString());
+                outputJobID = header.jobID;
+            } else if (frameLength === 0) {
+                worker.releaseOutput(outputJobID);
+                if (output) {
+                    output.end();
+                }
+                outputJobID = null;
+            } else if (output) {
+                worker.written[outputJobID] = true;
+                output.write(frame);
+            }
+        }
+    };
+}
@@ -5,7 +5,8 @@ var config = require('../config/config.js');
 module.exports = {
     getBucketHandle: getBucketHandle,
     getPublicUrl: getPublicUrl,
-    uploadFileToBucket: uploadFileToBucket
+    uploadFileToBucket: uploadFileToBucket,
+    createUploadStream: createUploadStream
 };
 
 function getBucketHandle(strBucket, env) {
@@ -34,3 +35,10 @@ function uploadFileToBucket(bucketHandle, localPath, bucketPath, cb) {
     bucketHandle.upload(localPath, options, cb);
 }
 
+// writable stream uploading whatever is written to it, emits 'finish' once the upload is complete
+function createUploadStream(bucketHandle, bucketPath) {
+    var options = {
+        validation: 'crc32c'
+    };
+    return bucketHandle.file(bucketPath).createWriteStream(options);
+}
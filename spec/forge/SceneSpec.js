@@ -280,7 +280,49 @@ describe("Scene Module", function() {
 
     });
 
+    describe("format version 7", function() {
+        var packedModel = function() {
+            return {
+                metadata: { formatVersion: 7, precision: 0.25 },
+                meshes: [{
+                    id: "primary___band",
+                    numvertices: 3,
+                    numtriangles: 2,
+                    vertexScale: 0.5,
+                    vertexOffset: [-1, 0, 0.25],
+                    vertices: "AAAABgAAAAgA",
+                    triangles: "AAICAAEB"
+                }],
+                operators: [{
+                    id: "primary___band___other___width_primary___band",
+                    mesh: "primary___band",
+                    parameters: {
+                        modifiedCount: 2,
+                        displacementScale: 0.25,
+                        indices: "AgI=",
+                        displacements: "BAMA2AQAAQ=="
+                    }
+                }]
+            };
+        };
+
+        it("should unpack fixed-point positions and delta-coded triangles", function() {
+            var mesh = Scene.decodeModel(packedModel()).meshes[0];
+            expect(Array.prototype.slice.call(mesh.vertices)).toEqual([-1, 0, 0.25, 0.5, 0, 0.25, -1, 2, 0.25]);
+            expect(Array.prototype.slice.call(mesh.triangles)).toEqual([0, 1, 2, 2, 1, 0]);
+        });
 
+        it("should unpack operator indices and multi-byte displacements", function() {
+            var params = Scene.decodeModel(packedModel()).operators[0].parameters;
+            expect(Array.prototype.slice.call(params.indices)).toEqual([1, 2]);
+            expect(Array.prototype.slice.call(params.displacements)).toEqual([0.5, -0.5, 0, 75, 0, -0.25]);
+        });
+
+        it("should leave earlier versions untouched", function() {
+            var model = { metadata: { formatVersion: 6 }, meshes: [{ vertices: [1, 2, 3], triangles: [0] }], operators: [] };
+            expect(Scene.decodeModel(model).meshes[0].vertices).toEqual([1, 2, 3]);
+        });
+    });
 });
 
 // test of model served from local dev server